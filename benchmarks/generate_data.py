@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from utils.mongo_utils import PROJECTION
+
+# Value pools of the categorical fields (None means the field is absent from the document)
+SKUS = ["quantify_kit", "quantify_plus_kit", "quantify_microtainer_collection_kit", "heart_health_kit"]
+SKU_TYPES = ["BLOOD", "BLOOD_PLUS", "DNA_METHYLATION", "CORTISOL"]
+BUSINESS_KEYS = ["siphox", "partner_a", "partner_b", None]
+COUNTRIES = ["US", "CA", None]
+
+# Lifecycle events in the order a kit goes through them; "sampleResulted" stands for
+# the lab outcome, which is either sampleResulted or sampleRejected
+EVENTS = [
+    "kitInTransit", "kitDelivered", "kitRegistered", "sampleInTransit",
+    "sampleDelivered", "sampleReceived", "sampleResulted", "orderPublished",
+]
+EXCEPTION_FLAGS = ["sampleCollectionException", "sampleDeliveryException", "sampleCanceled", "kitCanceled"]
+
+# Encode a boolean column like pull_mongo_frame does: bool, or True/False/NaN objects if any is missing
+def _bool_column(values, missing):
+    if not missing.any():
+        return values
+    column = values.astype(object)
+    column[missing] = np.nan
+    return column
+
+# Pick values from a pool, returning NaN where the pool entry is None
+def _choice(rng, pool, n):
+    values = np.array(pool, dtype=object)[rng.integers(len(pool), size=n)]
+    values[pd.isna(values)] = np.nan
+    return values
+
+def generate_frame(n, seed=0, start=datetime(2023, 1, 15), span_days=730):
+    """Seeded synthetic spot-history-statuses rows, shaped like pull_mongo_frame output.
+
+    Each row is a kit at a random stage of its lifecycle: event flags are set for the
+    stages it went through (10% of delivered/received flags are flipped, 3% of flags
+    are missing), *Diff fields hold days since createdDate for the events that happened,
+    and about 3% of rows have an exception or cancellation. Built column-wise so millions
+    of rows take seconds.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(n)
+    # Mongo stores dates with millisecond precision
+    created = np.datetime64(start, "ms") + (rng.uniform(0, span_days * 86400, n) * 1e3).astype("timedelta64[ms]")
+
+    columns = {
+        "lastUpdatedDate": None,
+        "createdDate": created,
+        "sampleID": np.array([f"S{i:08d}" for i in ids], dtype=object),
+        "orderID": np.repeat(np.array([f"O{i:08d}" for i in range((n + 1) // 2)], dtype=object), 2)[:n],
+        "businessKey": _choice(rng, BUSINESS_KEYS, n),
+        "country": _choice(rng, COUNTRIES, n),
+        "spotSku": _choice(rng, SKUS, n),
+        "spotSkuType": _choice(rng, SKU_TYPES, n),
+    }
+    for flag in EXCEPTION_FLAGS:
+        columns[flag] = _bool_column(rng.random(n) < 0.03, rng.random(n) < 0.01)
+
+    stage = rng.integers(0, len(EVENTS) + 2, n)
+    times = np.cumsum(rng.exponential(2.0, (n, len(EVENTS))), axis=1)
+    rejected = rng.random(n) < 0.1
+    for step, event in enumerate(EVENTS):
+        done = step < stage
+        diff = np.where(done & (rng.random(n) > 0.02), times[:, step], np.nan)
+        if event == "sampleResulted":
+            columns["sampleResulted"] = done & ~rejected
+            columns["sampleResultedDiff"] = np.where(rejected, np.nan, diff)
+            columns["sampleRejected"] = done & rejected
+            columns["sampleRejectedDiff"] = np.where(rejected, diff, np.nan)
+            continue
+        if event in ("sampleDelivered", "sampleReceived"):
+            done = done ^ (rng.random(n) < 0.1)
+        missing = rng.random(n) < 0.03
+        columns[event] = _bool_column(done, missing)
+        columns[event + "Diff"] = np.where(missing, np.nan, diff)
+
+    columns["sampleCollectedDiff"] = np.where(rng.random(n) < 0.5, times[:, -1] / 2, np.nan)
+    columns["lastUpdatedDate"] = created + (times[:, -1] * 86400e3).astype("timedelta64[ms]")
+
+    fields = [field for field, include in PROJECTION.items() if include]
+    columns["createdDate"] = created.astype("datetime64[ns]")
+    columns["lastUpdatedDate"] = columns["lastUpdatedDate"].astype("datetime64[ns]")
+    return pd.DataFrame({field: columns[field] for field in fields})
+
+def generate_documents(n, seed=0, **kwargs):
+    """The rows of generate_frame as Mongo documents (missing fields left out), e.g. to
+    seed a test collection."""
+    frame = generate_frame(n, seed, **kwargs)
+    for record in frame.to_dict("records"):
+        yield {field: value for field, value in record.items() if not pd.isna(value)}
@@ -0,0 +1,90 @@
+import argparse
+import os
+import time
+
+# Keep the stage logs of the pulls out of the benchmark output
+os.environ.setdefault("STAGE_LOG", "off")
+
+import pymongo
+from pymongo import uri_parser
+
+from utils import mongo_utils
+from utils.mongo_utils import MONGO_URI, get_mongo_client, close_mongo_client, pull_mongo_frame
+from benchmarks.generate_data import generate_documents
+
+DATABASE = "quantify"
+COLLECTION = "spot-history-statuses"
+# Hosts --seed may drop the collection of without --i-know
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+# Whether every host of a connection string is this machine (an SRV record never is)
+def is_local(uri):
+    if not uri or uri.startswith("mongodb+srv://"):
+        return False
+    return all(host in LOCAL_HOSTS for host, _ in uri_parser.parse_uri(uri)["nodelist"])
+
+# Fill the collection of a scratch mongod with synthetic documents
+def seed(client, size):
+    collection = client[DATABASE][COLLECTION]
+    collection.drop()
+    batch = []
+    for document in generate_documents(size):
+        batch.append(document)
+        if len(batch) == 10000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+# Time `runs` connect+pull rounds, either with a new client each time (the old
+# connect_mongo behaviour) or with the pooled process-wide client
+def time_pulls(runs, pooled, query=None):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        if pooled:
+            client = get_mongo_client()
+        else:
+            client = pymongo.MongoClient(mongo_utils.MONGO_URI)
+            client.admin.command("ping")
+        df = pull_mongo_frame(client, query)
+        timings.append(time.perf_counter() - start)
+        if not pooled:
+            client.close()
+    return timings, len(df)
+
+def report(label, timings, rows):
+    print(f"{label:<28} rows {rows:>8}  first {timings[0]:7.3f}s  "
+          f"median {sorted(timings)[len(timings) // 2]:7.3f}s  min {min(timings):7.3f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare a new MongoClient per pull with the pooled client, against --uri "
+                    "(point it at a scratch mongod: --seed drops and refills the collection)")
+    parser.add_argument("--uri", default=MONGO_URI, help="connection string (default MONGO_URI)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, metavar="SIZE", help="first load SIZE synthetic documents")
+    parser.add_argument("--small", action="store_true", help="pull one day of documents instead of all")
+    parser.add_argument("--i-know", action="store_true", help="allow --seed on a host other than localhost")
+    args = parser.parse_args()
+    if args.seed and not args.i_know and not is_local(args.uri):
+        parser.error(f"--seed drops {DATABASE}.{COLLECTION}; refusing on a host other than localhost "
+                     "(pass --uri mongodb://localhost:27017, or --i-know to seed it anyway)")
+
+    mongo_utils.MONGO_URI = args.uri
+    if get_mongo_client() is None:
+        raise SystemExit("MongoDB unreachable at --uri")
+    if args.seed:
+        seed(get_mongo_client(), args.seed)
+        close_mongo_client()
+    query = None
+    if args.small:
+        newest = get_mongo_client()[DATABASE][COLLECTION].find_one(sort=[("lastUpdatedDate", -1)])
+        query = {"lastUpdatedDate": {"$gte": newest["lastUpdatedDate"].replace(hour=0, minute=0)}}
+        close_mongo_client()
+
+    report("new client per pull", *time_pulls(args.runs, pooled=False, query=query))
+    report(f"pooled ({mongo_utils.MONGO_COMPRESSORS or 'no compression'})", *time_pulls(args.runs, pooled=True, query=query))
+    close_mongo_client()
+    mongo_utils.MONGO_COMPRESSORS = ""
+    report("pooled (no compression)", *time_pulls(args.runs, pooled=True, query=query))
@@ -0,0 +1,189 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+
+import bson
+import numpy as np
+import pandas as pd
+import psutil
+from bson.raw_bson import RawBSONDocument
+
+# The pipelines' own stage logs would interleave with the benchmark table; set STAGE_LOG to keep them
+os.environ.setdefault("STAGE_LOG", "off")
+
+import prepare_data
+import daily_stats
+import monthly_stats
+from utils.mongo_utils import PROJECTION, documents_to_frame
+from utils.profiling_utils import stage
+from utils.rollup_utils import build_rollup, monthly_summary
+from utils.sketch_utils import build_sketches
+from benchmarks.generate_data import generate_frame, generate_documents
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+RESULTS_DIR = os.path.join("benchmarks", "results")
+# Largest size for which the Mongo decoding stage runs (it holds every raw BSON document in memory)
+DECODE_MAX_SIZE = 1_000_000
+
+# Fixed report time and period so runs at different dates are comparable
+AS_OF = datetime(2025, 1, 15, 12, 0)
+REPORT_YEAR = 2024
+REPORT_MONTHS = list(range(1, 13))
+
+# Dashboard filters equivalent to its "Autofill Preset Values" button
+PRESET_FILTERS = {
+    "orderID": "", "sampleID": "", "businessKey": [], "country": [], "spotSku": [], "spotSkuType": [],
+    "createdDate": None, "kitRegistered": None, "registeredDate": None, "targetDate": None,
+    "breaksGuarantee": None, "sampleInTransit": None, "droppedOffDate": None, "sampleDelivered": None,
+    "deliveredDate": None, "sampleReceived": None, "receivedDate": None, "sampleProcessed": None,
+    "sampleResulted": None, "resultedDate": None, "sampleRejected": None, "rejectedDate": None,
+    "orderPublished": None, "publishedDate": None,
+    "kitShippingTime": (None, None), "shippingTime": (0.49, 31.00), "labProcessingTime": (0.10, 30.00),
+    "reportPublishingTime": (None, None), "totalProcessingTime": (None, None),
+    "selectedYears": [REPORT_YEAR], "selectedMonths": [6],
+}
+
+# Run fn(*args) as a measured stage, return its result and the stage record
+def measure(name, size, fn, *args):
+    gc.collect()
+    rows = len(args[0]) if args and hasattr(args[0], "__len__") else None
+    with stage(name, rows=rows, log=False, size=size) as record:
+        result = fn(*args)
+    record["rows_out"] = len(result) if hasattr(result, "__len__") and not isinstance(result, str) else None
+    print(f"{size:>9} {name:<32} {record['seconds']:9.3f}s {record['peak_rss_delta_mib']:9.1f} MiB")
+    return result, record
+
+# Import the dashboard filter lazily: it needs streamlit, which the batch host may not have
+def _load_filter_dataframe():
+    try:
+        from utils.streamlit_utils import filter_dataframe
+    except ImportError as e:
+        print(f"Skipping filter_dataframe: {e}")
+        return None
+    return filter_dataframe
+
+# Decode raw BSON documents into the typed frame, as pull_mongo_frame does with a cursor
+def _decode(documents):
+    fields = [field for field, include in PROJECTION.items() if include]
+    return documents_to_frame(iter(documents), fields)
+
+# The decoding documents_to_frame replaced: a list of dicts, then pd.DataFrame(docs)
+def _decode_legacy(documents):
+    docs = bson.decode_all(b"".join(document.raw for document in documents))
+    return pd.DataFrame(docs)
+
+# All timed scenarios for one data size; with workers > 1 the base is also prepared in a
+# process pool of that size and compared with the serial run
+def run_size(size, seed, workers=1):
+    records = []
+    if size <= DECODE_MAX_SIZE:
+        documents = [RawBSONDocument(bson.encode(document)) for document in generate_documents(size, seed)]
+        _, record = measure("mongo.documents_to_frame", size, _decode, documents)
+        records.append(record)
+        _, record = measure("mongo.list_of_dicts", size, _decode_legacy, documents)
+        records.append(record)
+        del documents
+
+    raw, record = measure("generate", size, generate_frame, size, seed)
+    records.append(record)
+
+    base, record = measure("prepare_base", size, lambda df: prepare_data.apply_schema(prepare_data._prepare_frame(df)), raw)
+    records.append(record)
+    if workers > 1:
+        serial_seconds = record["seconds"]
+        _, record = measure(f"prepare_base.workers_{workers}", size, lambda df: prepare_data.apply_schema(prepare_data._prepare_frame(df, workers=workers)), raw)
+        records.append(record)
+        print(f"{size:>9} {'':<32} {serial_seconds / record['seconds']:9.2f}x speedup over serial")
+    del raw
+
+    df, record = measure("as_of", size, prepare_data.as_of, base, AS_OF)
+    records.append(record)
+    del base
+
+    report = monthly_stats.filter_extraneous_values(df)
+    _, record = measure("monthly.process_data_for_months", size, monthly_stats.process_data_for_months, report, REPORT_YEAR, REPORT_MONTHS)
+    records.append(record)
+    rollup, record = measure("rollup.build", size, build_rollup, df)
+    records.append(record)
+    _, record = measure("monthly.build_sketches", size, build_sketches, report)
+    records.append(record)
+    _, record = measure("monthly.rollup_summary", size, lambda r: monthly_summary(prepare_data.filter_skus(r), [(REPORT_YEAR, month) for month in REPORT_MONTHS]), rollup)
+    records.append(record)
+
+    in_lab, record = measure("daily.filter_daily", size, daily_stats.filter_daily, df, AS_OF)
+    records.append(record)
+    _, record = measure("daily.generate_message", size, daily_stats.generate_message, in_lab, AS_OF)
+    records.append(record)
+
+    filter_dataframe = _load_filter_dataframe()
+    if filter_dataframe is not None:
+        _, record = measure("dashboard.filter_dataframe", size, lambda frame: filter_dataframe(frame.copy(), PRESET_FILTERS), df)
+        records.append(record)
+    return records
+
+# Commit the benchmark ran against, marked dirty if the tree has local changes
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+def run(sizes, seed=0, output=None, workers=1):
+    revision = git_revision()
+    results = {
+        "commit": revision,
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "seed": seed,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "memory_gib": round(psutil.virtual_memory().total / 1024 ** 3, 1),
+        "records": [],
+    }
+    for size in sizes:
+        results["records"].extend(run_size(size, seed, workers))
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{revision}.json")
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output}")
+    return results
+
+# Print the time and memory ratio of every stage between two results files
+def compare(old_path, new_path):
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    old_records = {(r["size"], r["stage"]): r for r in old["records"]}
+    print(f"{'size':>9} {'stage':<32} {old['commit']:>12} {new['commit']:>12} {'time':>7} {'peak rss':>9}")
+    for r in new["records"]:
+        before = old_records.get((r["size"], r["stage"]))
+        if before is None:
+            continue
+        time_ratio = r["seconds"] / before["seconds"] if before["seconds"] else float("nan")
+        rss_ratio = r["peak_rss_delta_mib"] / before["peak_rss_delta_mib"] if before["peak_rss_delta_mib"] else float("nan")
+        print(f"{r['size']:>9} {r['stage']:<32} {before['seconds']:11.3f}s {r['seconds']:11.3f}s {time_ratio:6.2f}x {rss_ratio:8.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the report pipelines on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of generated documents")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="also time prepare_base in a process pool of this size")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files instead of running")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args.sizes, args.seed, args.output, args.workers)
@@ -1,61 +1,56 @@
 import pandas as pd
 from datetime import datetime, timedelta
+import argparse
 import os
 
-from prepare_data import prepare_data
-from utils.date_utils import calc_diff_days2
+from prepare_data import prepare_data, EXCLUDED_SKU_TYPES, EXCLUDED_SKUS
+from utils.aging_utils import in_lab_counts
+from utils.delta_utils import in_lab_snapshot, load_in_lab_snapshot, save_in_lab_snapshot, in_lab_deltas
 from utils.slack_utils import send_slack_message
 from utils.zapier_utils import send_email
-
-def filter_daily(df):
-    df = df[(df["sampleResulted"] == False) & (df["sampleRejected"] == False)]
-    df = df[[
-            "sampleID",
-            "spotSku",
-            "spotSkuType",
-            "daysSinceRegistered",
-            "registeredDate",
-            "daysSinceTransit",
-            "droppedOffDate",
-            "sampleDelivered",
-            "daysSinceDelivered",
-            "deliveredDate",
-            "sampleReceived",
-            "daysSinceReceived",
-            "receivedDate",
-            "lastUpdatedDate",
-            "breaksGuarantee",
-            "collectionRecorded",
-            "receivedOnTime",
-        ]]
-    
-    # filter dates to two weeks/months ago and round dates
-    two_weeks_ago = datetime.today() - timedelta(days=14)
-    two_months_ago = datetime.today() - timedelta(days=60)
-
-    df = df[df["lastUpdatedDate"] > two_weeks_ago]
-    # filter for extraneous values
-    df = df[df["daysSinceDelivered"] < 30]
-    df = df[df["droppedOffDate"] > two_months_ago]
-    
-    # filter for extraneous values
-    df = df[
-        ~df["spotSkuType"].isin(
-            [
-                "DNA_METHYLATION",
-                "CORTISOL",
-            ]
-        )
-    ]
-    df = df[
-        ~df["spotSku"].isin(
-            [
-                "quantify_microtainer_collection_kit",
-            ]
-        )
-    ]
-    
-    return df
+from utils.profiling_utils import stage, run_profiled
+from utils.export_utils import export_path, write_frame
+
+# Columns of the daily datasheet
+DAILY_COLUMNS = [
+    "sampleID",
+    "spotSku",
+    "spotSkuType",
+    "daysSinceRegistered",
+    "registeredDate",
+    "daysSinceTransit",
+    "droppedOffDate",
+    "sampleDelivered",
+    "daysSinceDelivered",
+    "deliveredDate",
+    "sampleReceived",
+    "daysSinceReceived",
+    "receivedDate",
+    "lastUpdatedDate",
+    "breaksGuarantee",
+    "collectionRecorded",
+    "receivedOnTime",
+]
+
+# samples still in the lab, updated in the last two weeks and dropped off in the last two
+# months, selected with one combined mask and copied once
+def filter_daily(df, today=None):
+    if today is None:
+        today = datetime.today()
+    two_weeks_ago = today - timedelta(days=14)
+    two_months_ago = today - timedelta(days=60)
+
+    mask = (
+        df["sampleResulted"].eq(False).fillna(False)
+        & df["sampleRejected"].eq(False).fillna(False)
+        & (df["lastUpdatedDate"] > two_weeks_ago)
+        # filter for extraneous values
+        & (df["daysSinceDelivered"] < 30)
+        & (df["droppedOffDate"] > two_months_ago)
+        & ~df["spotSkuType"].isin(EXCLUDED_SKU_TYPES)
+        & ~df["spotSku"].isin(EXCLUDED_SKUS)
+    )
+    return df.loc[mask.to_numpy(bool), DAILY_COLUMNS]
 
 # sanity check to ensure statistics are in order
 def statistics_sanity_check(data):
@@ -75,83 +70,101 @@ def statistics_sanity_check(data):
     Not Received on Time: {data[~received_on_time]['sampleID'].count()}"""
 
 
-# generates message to be sent in reports
-def generate_message(in_lab):
-    delivered_not_received = in_lab[
-        (in_lab["sampleDelivered"] == True) & (in_lab["sampleReceived"] == False)
-    ]["sampleID"].count()
-    received_not_delivered = in_lab[
-        (in_lab["sampleDelivered"] == False) & (in_lab["sampleReceived"] == True)
-    ]["sampleID"].count()
-
-    delivered_received = in_lab[
-        (in_lab["sampleDelivered"] == True) & (in_lab["sampleReceived"] == True)
-    ]
-    not_processed = delivered_received["sampleID"].count()
-    less_than_two_days = in_lab[(in_lab["daysSinceReceived"] < 2.0)]["sampleID"].count()
-    two_or_more_days = in_lab[in_lab["daysSinceReceived"] >= 2.0]["sampleID"].count()
-    samples_overdue = in_lab[in_lab["breaksGuarantee"] == True]
-
-    overdue_max = 0
-    overdue_med = 0
-    overdue_low = 0
-
-    for index, row in samples_overdue.iterrows():
-        days_overdue = calc_diff_days2(row["droppedOffDate"], datetime.today())
-        if days_overdue < 7.0:
-            overdue_low += 1
-        elif days_overdue < 12:
-            overdue_med += 1
-        else:
-            overdue_max += 1
-
-    today_date = datetime.today().date()
-    two_weeks_ago = datetime.today() - timedelta(days=14)
+# generates message to be sent in reports, with what changed since the last report if `deltas`
+# (the counts of in_lab_deltas and the time of that report as "since") are given
+def generate_message(in_lab, today=None, deltas=None):
+    if today is None:
+        today = datetime.today()
+
+    counts = in_lab_counts(in_lab, today)
+    overdue_lines = "\n".join(
+        f"            Samples overdue for {label} days: *{count}*" for label, count in counts["overdue_bands"].items()
+    )
+
+    today_date = today.date()
+    two_weeks_ago = today - timedelta(days=14)
+
+    changes = ""
+    datasheet = f"*Full Datasheet for kits from {two_weeks_ago.date()} to {today_date} can be found below"
+    if deltas is not None:
+        changes = f"""
+        ------------------------------------------------------------------------------
+        🔄 *Since the last report ({deltas['since']:%Y-%m-%d %H:%M}):*
+
+            New samples at USSL: *{deltas['arrived']}*
+            Samples resulted: *{deltas['resulted']}*
+            Samples rejected: *{deltas['rejected']}*
+            Samples newly overdue: *{deltas['newly_overdue']}*
+            Samples still overdue: *{deltas['still_overdue']}*
+"""
+        datasheet = "*The samples that changed since the last report can be found below"
 
     message = f"""
         *--- DAILY USSL STATISTICS FOR {today_date} ---*
         
-        📊 *Total samples at USSL:* *{in_lab['sampleID'].count()}*
+        📊 *Total samples at USSL:* *{counts['total']}*
         
         ------------------------------------------------------------------------------
         📦 USSL Pickup Time:
 
-            Samples delivered to USSL but not marked as received: *{delivered_not_received}*
-            Samples received but not yet processed: *{not_processed}*
+            Samples delivered to USSL but not marked as received: *{counts['delivered_not_received']}*
+            Samples received but not yet processed: *{counts['not_processed']}*
         
         ------------------------------------------------------------------------------
         ⏳ USSL Processing Time:
 
-            Samples received for <2 days: *{less_than_two_days}*       
-            Samples received for >=2 days: *{two_or_more_days}*
+            Samples received for <2 days: *{counts['less_than_two_days']}*       
+            Samples received for >=2 days: *{counts['two_or_more_days']}*
         
         ------------------------------------------------------------------------------
 
-        ⚠️ *Samples Overdue:* *{samples_overdue['sampleID'].count()}*
+        ⚠️ *Samples Overdue:* *{counts['overdue']}*
         _Categorized by business days since the user has dropped the sample off (we promise 3-5)_
 
-            Samples overdue for <7 days: *{overdue_low}*      
-            Samples overdue for <12 days: *{overdue_med}*       
-            Samples overdue for >=12 days: *{overdue_max}*
-
-        *Full Datasheet for kits from {two_weeks_ago.date()} to {today_date} can be found below
+{overdue_lines}
+{changes}
+        {datasheet}
         """
 
     return message
 
 
 # manages and runs functions
-def main():
-    # connect and pull data
-    df = prepare_data()
-    in_lab = filter_daily(df)
+def main(as_of_ts=None):
+    today = as_of_ts if as_of_ts is not None else datetime.today()
+
+    # connect and pull data, always up to the latest change (a cached snapshot would hide what
+    # changed since the last report)
+    df = prepare_data(exclude_skus=True, incremental=True, ttl=0, as_of_ts=today)
+    with stage("daily.filter", rows=len(df)) as record:
+        in_lab = filter_daily(df, today)
+        record["rows_out"] = len(in_lab)
     
-    # to csv
-    path0 = r"files\daily_statistics.csv"
-    in_lab.to_csv(path0, index=False)
+    # to csv (gzip-compressed by default, see EXPORT_FORMAT)
+    path0 = export_path(os.path.join("files", "daily_statistics"))
+    with stage("daily.csv_write", rows=len(in_lab)):
+        write_frame(in_lab, path0)
+
+    # changes since the last report, whose snapshot is only compared against and replaced by a
+    # later one; --as-of reruns never replace it, their rows being only approximately those of
+    # that time
+    attachment = path0
+    deltas = None
+    with stage("daily.deltas", rows=len(in_lab)) as record:
+        snapshot = in_lab_snapshot(in_lab, today)
+        previous, previous_as_of = load_in_lab_snapshot()
+        if previous is not None and previous_as_of < today:
+            changes, counts = in_lab_deltas(previous, snapshot, df)
+            deltas = {"since": previous_as_of, **counts}
+            attachment = export_path(os.path.join("files", "daily_changes"))
+            write_frame(changes, attachment)
+            record["changes"] = len(changes)
+        if as_of_ts is None and (previous is None or previous_as_of < today):
+            save_in_lab_snapshot(snapshot, today)
 
     # send data
-    message = generate_message(in_lab)
+    with stage("daily.aggregate", rows=len(in_lab)):
+        message = generate_message(in_lab, today, deltas)
 
     # NOTE: ONLY UNCOMMENT THE FOLLOWING LINES IF YOU ARE READY TO SEND STATISTICS TO SLACK / EMAIL
     # test id: C07DE075ZLG
@@ -159,11 +172,20 @@ def main():
     SLACK_DAILY_TOKEN = os.getenv("SLACK_DAILY_TOKEN")
     TEST_CHANNEL_ID = os.getenv("TEST_CHANNEL_ID")
     USSL_CHANNEL_ID = os.getenv("USSL_CHANNEL_ID")
-    send_slack_message(SLACK_DAILY_TOKEN, message, [path0], USSL_CHANNEL_ID)
+    send_slack_message(SLACK_DAILY_TOKEN, message, [attachment], USSL_CHANNEL_ID)
     #send_email(message, path0)
     return in_lab
 
 
 # executes main when running locally
 if __name__ == "__main__":
-    data = main()
+    parser = argparse.ArgumentParser(description="Daily USSL statistics")
+    parser.add_argument("--as-of", type=datetime.fromisoformat, default=None,
+                        help="approximate the report as of this time (ISO format), default now")
+    parser.add_argument("--profile", nargs="?", const=os.path.join("files", "daily_stats.prof"), default=None,
+                        help="run under cProfile and write the stats to this file")
+    args = parser.parse_args()
+    if args.profile:
+        data = run_profiled(main, args.profile, args.as_of)
+    else:
+        data = main(args.as_of)
@@ -1,14 +1,13 @@
 import streamlit as st
 import pandas as pd
-import streamlit_pandas as sp
 import streamlit_authenticator as stauth
-import psutil
-import os
 import yaml
 from datetime import datetime
 
-from prepare_data import prepare_data
-from utils.streamlit_utils import generate_dictionary, filter_dataframe
+from prepare_data import prepare_base, as_of, load_rollup, refresh_rollup, ROLLUP_PATH
+from utils.streamlit_utils import generate_dictionary, filter_dataframe, add_filter_keys, widget_metadata, FILTER_KEY_COLUMNS
+from utils.rollup_utils import rollup_metrics, frame_metrics
+from utils.export_utils import frame_bytes, export_path, MIME_TYPES, EXPORT_FORMAT
 
 st.set_page_config(page_title="SiPhox Statistics Dashboard", page_icon=":rocket:", layout="wide")
 
@@ -52,16 +51,23 @@ if st.session_state['authentication_status'] is True:
     st.write("> *Please note that all metrics are related to SAMPLES unless explicitly stated otherwise*")
     st.write("\n" * 10)
     
-    # Function to check memory usage
-    def print_memory_usage():
-        process = psutil.Process(os.getpid())
-        memory_info = process.memory_info()
-        st.write(f"Memory usage: {memory_info.rss / 1024 ** 2:.2f} MB")
-
-    # Cache the data preparation step
+    # Cache the time-invariant base frame (with the year/month keys of the sidebar filters),
+    # the monthly rollup kept in step with it and the sidebar options and ranges, shared by
+    # every session until the next refresh
     @st.cache_data(ttl=1800)
-    def load_and_prepare_data():
-        df = prepare_data()
+    def load_base_data():
+        # the rollup is advanced on the same minute clock as the tiles (see `now` below)
+        as_of_ts = datetime.now().replace(second=0, microsecond=0)
+        base = add_filter_keys(prepare_base(incremental=True, rollup_path=ROLLUP_PATH, as_of_ts=as_of_ts))
+        rollup, rollup_metadata = load_rollup(ROLLUP_PATH)
+        return base, rollup, rollup_metadata, widget_metadata(base)
+
+    # Cache the clock-dependent overlay too (as_of copies the whole base), per minute: every
+    # rerun within the same minute reuses it instead of recomputing it
+    @st.cache_data(ttl=1800, max_entries=2)
+    def load_and_prepare_data(ts):
+        base, _, _, _ = load_base_data()
+        df = as_of(base, ts)
         columns = [
             'orderID', 'sampleID', 'businessKey', 'country', 'spotSku', 'spotSkuType', 
             'createdDate', 'kitShippingTime', 'kitRegistered', 'registeredDate', 'targetDate', 'breaksGuarantee', 
@@ -72,11 +78,19 @@ if st.session_state['authentication_status'] is True:
             'totalProcessingTime'
         ]
 
-        selected_columns = df[columns]
+        selected_columns = df[columns + FILTER_KEY_COLUMNS]
         return selected_columns
 
-    df = load_and_prepare_data()
-    cols = []
+    # Cache the encoded export on the data minute and the filters, so it is only encoded again
+    # when one of them changes, not on every rerun
+    @st.cache_data(ttl=1800, max_entries=4)
+    def export_bytes(ts, filters):
+        return frame_bytes(filter_dataframe(load_and_prepare_data(ts), filters))
+
+    # One clock for the rows and the rollup, so the tiles agree with the table, truncated to
+    # the minute the overlay is cached for
+    now = datetime.now().replace(second=0, microsecond=0)
+    df = load_and_prepare_data(now)
 
     # Define preset values
     preset_values = {
@@ -118,10 +132,11 @@ if st.session_state['authentication_status'] is True:
         st.experimental_rerun()
 
     # Generate widgets and get filters
+    _, _, _, metadata = load_base_data()
     if st.session_state.preset_button:
-        filters = generate_dictionary(df, preset_values)
+        filters = generate_dictionary(df, preset_values, metadata)
     else:
-        filters = generate_dictionary(df)
+        filters = generate_dictionary(df, metadata=metadata)
 
     if filters is None:
         st.error("Data dictionary is not generated properly.")
@@ -129,8 +144,6 @@ if st.session_state['authentication_status'] is True:
 
     filtered_df = filter_dataframe(df, filters)
 
-    all_widgets = sp.create_widgets(df, filters, ignore_columns=cols)
-
     # Calculate averages and display metrics
     time_columns = ["totalProcessingTime", "kitShippingTime", "shippingTime", "labProcessingTime", "reportPublishingTime"]
     column_titles = {
@@ -144,22 +157,27 @@ if st.session_state['authentication_status'] is True:
     # Create columns for metrics
     cols = st.columns(len(time_columns) + 3)  # Add extra columns for the new metrics
 
+    # Read the tiles from the rollup (advanced to now) when the filters only use its keys,
+    # otherwise compute them from the filtered rows
+    base, rollup, rollup_metadata, _ = load_base_data()
+    metrics = None
+    if rollup is not None:
+        rollup, _ = refresh_rollup(rollup, rollup_metadata, base, now)
+        metrics = rollup_metrics(rollup, filters)
+    if metrics is None:
+        metrics = frame_metrics(filtered_df)
+
     for col, time_col in zip(cols[:len(time_columns)], time_columns):
-        if time_col in filtered_df.columns:
-            avg_value = filtered_df[time_col].mean()
-            col.metric(label=column_titles[time_col], value=f"{avg_value:.2f}")
+        col.metric(label=column_titles[time_col], value=f"{metrics[time_col]:.2f}")
 
     # Add the Total Samples Processed metric
-    num_processed = filtered_df['sampleProcessed'].sum()
-    cols[len(time_columns)].metric(label="Total Samples Processed", value=int(num_processed))
+    cols[len(time_columns)].metric(label="Total Samples Processed", value=metrics["samples_processed"])
 
     # Add the Number of Samples Overdue metric
-    num_overdue = filtered_df['breaksGuarantee'].sum()
-    cols[len(time_columns) + 1].metric(label="Number of Samples Overdue", value=int(num_overdue))
+    cols[len(time_columns) + 1].metric(label="Number of Samples Overdue", value=metrics["samples_overdue"])
 
     # Add the Total Samples On Time metric
-    num_on_time = (filtered_df['totalProcessingTime'] <= 5).sum()
-    cols[len(time_columns) + 2].metric(label="Total Samples On Time (<= 5 days)", value=int(num_on_time))
+    cols[len(time_columns) + 2].metric(label="Total Samples On Time (<= 5 days)", value=metrics["samples_on_time"])
 
     st.dataframe(filtered_df)
 
@@ -167,13 +185,12 @@ if st.session_state['authentication_status'] is True:
     row_count = filtered_df.shape[0]
     st.write(f"Total Count: {row_count}")
 
-    # Create a button to download the DataFrame as a CSV file
-    csv = filtered_df.to_csv(index=False).encode('utf-8')
+    # Create a button to download the DataFrame as a (compressed, see EXPORT_FORMAT) file
     st.download_button(
-        label="Export as CSV",
-        data=csv,
-        file_name='data_export.csv',
-        mime='text/csv'
+        label="Export Data",
+        data=export_bytes(now, filters),
+        file_name=export_path('data_export'),
+        mime=MIME_TYPES[EXPORT_FORMAT]
     )
     
     st.write("\n" * 10)
@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+import pandas as pd
+from dotenv import load_dotenv
+
+from prepare_data import prepare_base, prepare_documents, apply_schema, as_of, SNAPSHOT_PATH
+from daily_stats import filter_daily
+from utils.aging_utils import in_lab_counts
+from utils.change_utils import change_source, replay_changes
+from utils.mongo_utils import PROJECTION, documents_to_frame, connect_mongo
+from utils.snapshot_utils import read_snapshot_metadata
+
+load_dotenv()
+
+# Where the monitor keeps the current in-lab counts, read by `monitor.py --status`
+MONITOR_STATUS_PATH = os.getenv("MONITOR_STATUS_PATH", os.path.join("files", "in_lab_monitor.json"))
+# Seconds between two recounts when no change arrives (the aging bands move with the clock)
+MONITOR_REFRESH_SECONDS = float(os.getenv("MONITOR_REFRESH_SECONDS", "300"))
+
+FIELDS = [field for field, include in PROJECTION.items() if include]
+
+# Samples that are or may become in lab without their document changing: neither resulted nor
+# rejected, and updated and dropped off recently enough for filter_daily (with a day of margin
+# for its rounded dates). Any other sample only comes back through a change of its document.
+def open_samples(base, now):
+    mask = (
+        base["sampleResulted"].eq(False).fillna(False)
+        & base["sampleRejected"].eq(False).fillna(False)
+        & (base["lastUpdatedDate"] > now - timedelta(days=15))
+        & (base["droppedOffDate"] > now - timedelta(days=61))
+    )
+    return base[mask.to_numpy(bool)]
+
+# Replace the rows of the changed documents by their prepared version (if still open)
+def apply_changes(samples, documents, now):
+    changed = documents_to_frame(documents, FIELDS)
+    prepared = prepare_documents(changed, exclude_skus=True)
+    samples = samples[~samples["sampleID"].isin(changed["sampleID"])]
+    return apply_schema(pd.concat([samples, open_samples(prepared, now)], ignore_index=True))
+
+# The counts of the daily message for the open samples as of `now`
+def current_counts(samples, now):
+    in_lab = filter_daily(as_of(samples, now), now)
+    return {"as_of": now.isoformat(timespec="seconds"), **in_lab_counts(in_lab, now)}
+
+def write_status(counts, path=MONITOR_STATUS_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(counts, file, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def read_status(path=MONITOR_STATUS_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+# Follow spot-history-statuses and keep the in-lab counts in MONITOR_STATUS_PATH current. The
+# open samples are loaded once from the prepared snapshot, then only changed documents are
+# prepared and swapped in, and the counts are recomputed over the open samples alone.
+# `source` yields batches of changed documents (default: change stream, else polling).
+def monitor(source=None, status_path=MONITOR_STATUS_PATH, refresh_seconds=MONITOR_REFRESH_SECONDS):
+    now = datetime.now()
+    samples = open_samples(prepare_base(incremental=True, exclude_skus=True), now)
+    if source is None:
+        client = connect_mongo()
+        if client is None:
+            print("MongoDB unavailable, nothing to monitor")
+            return None
+        metadata = read_snapshot_metadata(SNAPSHOT_PATH)
+        source = change_source(client, metadata["watermark"] if metadata else None)
+
+    counts = None
+    last_count = None
+    for documents in source:
+        now = datetime.now()
+        if documents:
+            samples = apply_changes(samples, documents, now)
+        if documents or last_count is None or (now - last_count).total_seconds() >= refresh_seconds:
+            samples = open_samples(samples, now)
+            counts = current_counts(samples, now)
+            write_status(counts, status_path)
+            last_count = now
+            print(
+                f"{counts['as_of']} {len(documents)} changes: {counts['total']} at USSL, "
+                f"{counts['overdue']} overdue {counts['overdue_bands']}"
+            )
+    return counts
+
+# Runs the monitor (until interrupted, unless replaying a file) or prints the current counts
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-real-time USSL in-lab monitor")
+    parser.add_argument("--status", action="store_true", help="print the counts of the running monitor and exit")
+    parser.add_argument("--replay", help="read changed documents from this Extended JSON lines file instead of Mongo")
+    parser.add_argument("--replay-batch", type=int, default=100, help="documents per batch of --replay")
+    parser.add_argument("--replay-interval", type=float, default=0.0, help="seconds between batches of --replay")
+    args = parser.parse_args()
+    if args.status:
+        print(json.dumps(read_status(), indent=2))
+    else:
+        source = replay_changes(args.replay, args.replay_batch, args.replay_interval) if args.replay else None
+        try:
+            monitor(source)
+        except KeyboardInterrupt:
+            pass
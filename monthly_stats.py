@@ -3,159 +3,51 @@ from datetime import datetime
 import numpy as np
 import calendar
 import os
-import matplotlib.pyplot as plt
-
-from prepare_data import prepare_data
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from prepare_data import prepare_data, filter_skus, load_rollup, ROLLUP_PATH
+from utils.rollup_utils import monthly_summary, contributions, period_of
+from utils.date_utils import month_range, previous_month
+from utils.sketch_utils import build_sketches, save_sketches, select_sketches, box_stats_table, period_quantiles
+from utils.plot_utils import figure_spec, figure_specs, render_figures
+from utils.export_utils import export_months
 from utils.slack_utils import send_slack_message
+from utils.profiling_utils import stage, run_profiled
+
+# Where backfills write their consolidated summary and one directory of artifacts per month
+BACKFILL_DIR = os.getenv("BACKFILL_DIR", os.path.join("files", "backfill"))
+# Worker processes of a backfill, one month at a time each
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", str(os.cpu_count() or 1)))
 
 def filter_extraneous_values(df):
     # filter for extraneous values
-    df = df[
-        ~df["spotSkuType"].isin(
-            [
-                "DNA_METHYLATION",
-                "CORTISOL",
-            ]
-        )
-    ]
-    df = df[
-        ~df["spotSku"].isin(
-            [
-                "quantify_microtainer_collection_kit",
-            ]
-        )
-    ]
-    
-    return df
+    return filter_skus(df)
 
 # Function to process data for specified months of a given year
 def process_data_for_months(df, year, months):
-    monthly_data = {}
-
-    for month in months:
-        # Filter data for the given month and year
-        month_data = df[
-            ((df["receivedDate"].dt.month == month) & 
-            (df["receivedDate"].dt.year == year)) | 
-            ((df["rejectedDate"].dt.month == month) & 
-            (df["rejectedDate"].dt.year == year))
-        ]
-
-        # Calculate statistics for completed samples
-        completed_samples = month_data[(month_data['sampleResulted'] == True) | (month_data['sampleRejected'] == True)]
-        total_completed_samples = completed_samples.shape[0]
-        total_kits_resulted = completed_samples['sampleResulted'].sum()
-        total_kits_rejected = completed_samples['sampleRejected'].sum()
-        uncounted_kits = total_completed_samples - (total_kits_resulted + total_kits_rejected)
-        
-        # Generate warnings based on uncounted kits
-        warning = ""
-        if uncounted_kits > 0:
-            warning = f"WARNING: there are {uncounted_kits} samples in this data that are not resulted or rejected"
-        elif uncounted_kits < 0:
-            warning = f"WARNING: there are {uncounted_kits * -1} samples in this data that are both resulted and rejected"
-
-        # Calculate shipping statistics
-        shipped_samples = completed_samples[completed_samples['shippingTime'].notna()]
-        kits_shipped_usps = shipped_samples['shippingTime'].notna().sum()
-        avg_shipping_time = shipped_samples['shippingTime'].mean().round(2)
-        shipped_under_3 = shipped_samples[shipped_samples["shippingTime"] <= 3]['shippingTime'].notna().sum()
-        shipped_under_5 = shipped_samples[(shipped_samples["shippingTime"] <= 5) & (shipped_samples["shippingTime"] > 3)]['shippingTime'].notna().sum()
-        shipped_over_5 = shipped_samples[shipped_samples["shippingTime"] > 5]['shippingTime'].notna().sum()
-
-        # Calculate lab processing statistics
-        processed_samples = completed_samples[completed_samples['labProcessingTime'].notna()]
-        samples_processed_ussl = processed_samples['labProcessingTime'].notna().sum()
-        avg_lab_processing_time = processed_samples['labProcessingTime'].mean().round(2)
-        processed_under_2 = processed_samples[processed_samples["labProcessingTime"] <= 2]['labProcessingTime'].notna().sum()
-        processed_under_4 = processed_samples[(processed_samples["labProcessingTime"] <= 4) & (processed_samples["labProcessingTime"] > 2)]['labProcessingTime'].notna().sum()
-        processed_over_4 = processed_samples[processed_samples["labProcessingTime"] > 4]['labProcessingTime'].notna().sum()
-
-        # Calculate report publishing statistics
-        published_samples = completed_samples[completed_samples['reportPublishingTime'].notna()]
-        reports_published_siphox = published_samples['reportPublishingTime'].notna().sum()
-        avg_report_publishing_time = published_samples['reportPublishingTime'].mean().round(2)
-        published_under_2 = published_samples[published_samples["reportPublishingTime"] <= 2]['reportPublishingTime'].notna().sum()
-        published_over_2 = published_samples[published_samples["reportPublishingTime"] > 2]['reportPublishingTime'].notna().sum()
-
-        # Calculate total processing statistics
-        avg_total_processing_time = month_data['totalProcessingTime'].mean().round(2)
-        breaks_guarantee = completed_samples[completed_samples['breaksGuarantee'] == True]
-        num_breaks_guarantee = breaks_guarantee['totalProcessingTime'].notna().sum()
-        breaks_guarantee_under_7 = breaks_guarantee[(breaks_guarantee['totalProcessingTime'] < 7) & (breaks_guarantee['totalProcessingTime'] >= 5)]['totalProcessingTime'].notna().sum()
-        breaks_guarantee_under_12 = breaks_guarantee[(breaks_guarantee['totalProcessingTime'] < 12) & (breaks_guarantee['totalProcessingTime'] >= 7)]['totalProcessingTime'].notna().sum()
-        breaks_guarantee_max = breaks_guarantee[breaks_guarantee['totalProcessingTime'] >= 12]['totalProcessingTime'].notna().sum()
-
-        # Store monthly statistics
-        monthly_data[month] = {
-            "Month": int(month),
-            "total_completed_samples": total_completed_samples,
-            "total_kits_resulted": total_kits_resulted,
-            "total_kits_rejected": total_kits_rejected,
-            "kits_shipped_usps": kits_shipped_usps,
-            "avg_shipping_time": avg_shipping_time,
-            "shipped_under_3": shipped_under_3,
-            "shipped_under_5": shipped_under_5,
-            "shipped_over_5": shipped_over_5,
-            "samples_processed_ussl": samples_processed_ussl,
-            "avg_lab_processing_time": avg_lab_processing_time,
-            "processed_under_2": processed_under_2,
-            "processed_under_4": processed_under_4,
-            "processed_over_4": processed_over_4,
-            "reports_published_siphox": reports_published_siphox,
-            "avg_report_publishing_time": avg_report_publishing_time,
-            "published_under_2": published_under_2,
-            "published_over_2": published_over_2,
-            "avg_total_processing_time": avg_total_processing_time,
-            "num_breaks_guarantee": num_breaks_guarantee,
-            "breaks_guarantee_under_7": breaks_guarantee_under_7,
-            "breaks_guarantee_under_12": breaks_guarantee_under_12,
-            "breaks_guarantee_max": breaks_guarantee_max,
-            "warning": warning,
-        }
-
-    return pd.DataFrame(monthly_data).transpose()
-
-import matplotlib.pyplot as plt
-
-def plot_boxplots(df, year, month):
-    # Filter data for the given month and year
-    current_month_data = df[
-        ((df["receivedDate"].dt.month == month) & 
-        (df["receivedDate"].dt.year == year)) | 
-        ((df["rejectedDate"].dt.month == month) & 
-        (df["rejectedDate"].dt.year == year))
-    ]
-    
-    completed_samples = current_month_data[(current_month_data['sampleResulted'] == True) | (current_month_data['sampleRejected'] == True)]
-    
-    fig, axes = plt.subplots(nrows=3, ncols=1, figsize=(15, 10))
-
-    # Set the title for the entire figure
-    fig.suptitle(f'Month {month} Processing Times', fontsize=16)
-
-    # Plot USPS Shipping Times
-    axes[0].boxplot(completed_samples['shippingTime'].dropna(), vert=False, patch_artist=True, showfliers=False)
-    axes[0].set_xlabel('Shipping Time (days)')
-    axes[0].set_title('USPS Shipping Times')
-
-    # Plot USSL Lab Processing Times
-    axes[1].boxplot(completed_samples['labProcessingTime'].dropna(), vert=False, patch_artist=True, showfliers=False)
-    axes[1].set_xlabel('Lab Processing Time (days)')
-    axes[1].set_title('USSL Lab Processing Times')
-
-    # Plot SiPhox Report Publishing Times
-    axes[2].boxplot(completed_samples['reportPublishingTime'].dropna(), vert=False, patch_artist=True, showfliers=False)
-    axes[2].set_xlabel('Report Publishing Time (days)')
-    axes[2].set_title('SiPhox Report Publishing Times')
-
-    plt.subplots_adjust(hspace=0.5)
-    # Save the plot as an image
-    image_path = r'files\monthly_processing_times.png'
-    plt.savefig(image_path)
-    plt.close()
-
-    return image_path
+    return process_data_for_periods(df, [(year, month) for month in months])
+
+# Function to process data for a list of (year, month) periods, which may span years, in one
+# grouped pass over the rows (see monthly_summary)
+def process_data_for_periods(df, periods):
+    return monthly_summary(contributions(df), periods)
+
+# Box plots of the month's processing times, drawn from the quantile sketches rather than
+# the raw values (and only redrawn when they changed)
+def plot_boxplots(sketches, year, month):
+    stats = box_stats_table(sketches, [(year, month)]).set_index("measure")
+    spec = figure_spec(os.path.join("files", "monthly_processing_times.png"), f"Month {month} Processing Times", stats)
+    render_figures([spec])
+    return spec["path"]
+
+# Figures of every month of `periods`, overall and per SKU, rendered in parallel into PLOT_DIR
+def plot_all_months(sketches, periods):
+    specs = figure_specs(box_stats_table(sketches, periods))
+    specs += figure_specs(box_stats_table(sketches, periods, by="spotSku"), by="spotSku")
+    paths, drawn = render_figures(specs)
+    print(f"Rendered {len(drawn)} of {len(paths)} figures ({len(paths) - len(drawn)} unchanged)")
+    return paths
 
     
 def generate_message(latest_row):
@@ -195,46 +87,47 @@ def generate_message(latest_row):
     ----------------------------------------------------------------------------------------------
     """
     
-def generate_raw_data(df):
-    last_month = datetime.now().month - 1
-    month_data = df[
-            ((df["receivedDate"].dt.month == last_month) & 
-            (df["receivedDate"].dt.year == datetime.now().year)) | 
-            ((df["rejectedDate"].dt.month == last_month) & 
-            (df["rejectedDate"].dt.year == datetime.now().year))
-    ]
-    
-    columns = [
-        'orderID', 'sampleID', 'businessKey', 'country', 'spotSku', 'spotSkuType', 
-        'createdDate', 'kitRegistered', 'registeredDate', 'targetDate', 'breaksGuarantee', 
-        'sampleInTransit', 'droppedOffDate', 'sampleDelivered', 'deliveredDate', 
-        'sampleReceived', 'receivedDate', 'sampleProcessed', 'sampleResulted', 
-        'resultedDate', 'sampleRejected', 'rejectedDate', 'orderPublished', 
-        'publishedDate', 'shippingTime', 'labProcessingTime', 'reportPublishingTime', 
-        'totalProcessingTime'
-    ]   
-    filtered_month_data = month_data[columns]
-
-    month_data_path = r"files\month_data_raw.csv"
-    filtered_month_data.to_csv(month_data_path, index=False)
-    
-    return month_data_path
-
-def main():
-    # Prepare data
-    df = prepare_data()
+# Raw data of every month of `periods`, one compressed file per month in EXPORT_DIR
+def generate_raw_data(df, periods):
+    return export_months(df, periods)
+
+# Months to report on: from `start` to `end` as (year, month), by default the year so far
+# up to the last complete month (in January, the whole previous year); `plot_all` also
+# renders the figures of every month and SKU into PLOT_DIR
+def main(start=None, end=None, plot_all=False):
+    # Prepare data, bringing the monthly rollup up to date as of the same time
+    df = prepare_data(exclude_skus=True, incremental=True, rollup_path=ROLLUP_PATH)
     df = filter_extraneous_values(df)
 
     # Define the months to process
-    last_month = datetime.now().month - 1
-    all_months = list(range(1, last_month + 1))
-    all_data = process_data_for_months(df, 2024, all_months)
+    if end is None:
+        end = previous_month(datetime.now())
+    if start is None:
+        start = (end[0], 1)
+    periods = month_range(start, end)
+    with stage("monthly.aggregate", months=len(periods)) as record:
+        rollup, _ = load_rollup(ROLLUP_PATH)
+        rollup = filter_extraneous_values(rollup)
+        record["rows"] = len(rollup)
+        all_data = monthly_summary(rollup, periods)
     
+    # Processing-time sketches, saved next to the summary with the quantiles of each month
+    with stage("monthly.sketch", rows=len(df)) as record:
+        sketches = build_sketches(df)
+        record["buckets"] = len(sketches)
+        save_sketches(sketches, os.path.join("files", "monthly_processing_time_sketches.parquet"))
+        period_quantiles(sketches, periods).to_csv(os.path.join("files", "monthly_processing_time_quantiles.csv"), index=False)
+
     # month data
-    month_data_path = generate_raw_data(df)
+    with stage("monthly.export", rows=len(df), months=len(periods)):
+        month_data_path = generate_raw_data(df, periods)[end]
     
     # Plot Data
-    image = plot_boxplots(df, 2024, last_month)
+    with stage("monthly.plot", rows=len(sketches)):
+        image = plot_boxplots(sketches, *end)
+    if plot_all:
+        with stage("monthly.plot_all", months=len(periods)):
+            plot_all_months(sketches, periods)
 
     # Generate message for the latest month's statistics
     latest_row = all_data.iloc[-1]
@@ -249,8 +142,9 @@ def main():
     )
 
     # Save the data to a CSV file
-    summary_path = r"files\monthly_processing_time_summary.csv"
-    all_data.to_csv(summary_path, index=False)
+    summary_path = os.path.join("files", "monthly_processing_time_summary.csv")
+    with stage("monthly.csv_write", rows=len(all_data), file="summary"):
+        all_data.to_csv(summary_path, index=False)
 
     # Send the message to Slack
     SLACK_MONTHLY_TOKEN = os.getenv("SLACK_MONTHLY_TOKEN")
@@ -258,6 +152,81 @@ def main():
     TEST_CHANNEL_ID = os.getenv("TEST_CHANNEL_ID")
     send_slack_message(SLACK_MONTHLY_TOKEN, final_message, [summary_path, month_data_path, image], OPS_CHANNEL_ID)
 
+# Process pool task: the summary row, quantiles, box plot and raw-data export of one month,
+# from the rows received or rejected in it and its sketch rows, written to <directory>/YYYY-MM
+def _backfill_month(year, month, rows, sketches, directory):
+    month_dir = os.path.join(directory, f"{year}-{month:02d}")
+    summary = process_data_for_periods(rows, [(year, month)])
+    quantiles = period_quantiles(sketches, [(year, month)])
+    os.makedirs(month_dir, exist_ok=True)
+    summary.to_csv(os.path.join(month_dir, "monthly_processing_time_summary.csv"), index=False)
+    quantiles.to_csv(os.path.join(month_dir, "monthly_processing_time_quantiles.csv"), index=False)
+
+    stats = box_stats_table(sketches, [(year, month)]).set_index("measure")
+    render_figures([figure_spec(os.path.join(month_dir, "monthly_processing_times.png"), f"Month {month} {year} Processing Times", stats)], workers=1)
+    export_months(rows, [(year, month)], directory=month_dir, prefix="month_data_raw")
+    return summary, quantiles
+
+# Rebuild the reports of every month from `start` to `end` without sending anything: the data
+# is prepared once, then the months are summarised, plotted and exported in `workers`
+# processes. Writes the consolidated summary and quantiles to `directory` and returns the summary.
+def backfill(start, end, directory=BACKFILL_DIR, workers=BACKFILL_WORKERS):
+    df = prepare_data(exclude_skus=True, incremental=True, rollup_path=ROLLUP_PATH)
+    df = filter_extraneous_values(df)
+    periods = month_range(start, end)
+
+    with stage("monthly.backfill.partition", rows=len(df), months=len(periods)):
+        sketches = build_sketches(df)
+        received = (df["receivedDate"].dt.year * 12 + df["receivedDate"].dt.month - 1).to_numpy()
+        rejected = (df["rejectedDate"].dt.year * 12 + df["rejectedDate"].dt.month - 1).to_numpy()
+        tasks = []
+        for year, month in periods:
+            period = period_of(year, month)
+            rows = df[(received == period) | (rejected == period)]
+            tasks.append((year, month, rows, select_sketches(sketches, [(year, month)]), directory))
+
+    with stage("monthly.backfill.months", months=len(periods), workers=workers):
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_backfill_month, *zip(*tasks)))
+        else:
+            results = [_backfill_month(*task) for task in tasks]
+
+    # the same columns as main's summary over these periods: Year only when they span years
+    summary = pd.concat([summary for summary, _ in results], ignore_index=True)
+    if len({year for year, _ in periods}) > 1:
+        summary.insert(0, "Year", [year for year, _ in periods])
+    quantiles = pd.concat([quantiles for _, quantiles in results], ignore_index=True)
+    os.makedirs(directory, exist_ok=True)
+    summary.to_csv(os.path.join(directory, "monthly_processing_time_summary.csv"), index=False)
+    quantiles.to_csv(os.path.join(directory, "monthly_processing_time_quantiles.csv"), index=False)
+    print(f"Backfilled {len(periods)} months ({periods[0][0]}-{periods[0][1]:02d} to {periods[-1][0]}-{periods[-1][1]:02d}) into {directory}")
+    return summary
+
+# Parse a YYYY-MM command line argument into (year, month)
+def _year_month(value):
+    date = datetime.strptime(value, "%Y-%m")
+    return date.year, date.month
+
 # Execute main function when running the script directly
 if __name__ == "__main__":
-    data = main()
+    parser = argparse.ArgumentParser(description="Monthly kit processing statistics")
+    parser.add_argument("--profile", nargs="?", const=os.path.join("files", "monthly_stats.prof"), default=None,
+                        help="run under cProfile and write the stats to this file")
+    parser.add_argument("--start", type=_year_month, help="first month to report, YYYY-MM (default January of --end's year)")
+    parser.add_argument("--end", type=_year_month, help="last month to report, YYYY-MM (default the last complete month)")
+    parser.add_argument("--all-plots", action="store_true",
+                        help="also render the processing-time figures of every month and SKU into PLOT_DIR")
+    parser.add_argument("--backfill", action="store_true",
+                        help="rebuild the reports of --start to --end into BACKFILL_DIR instead of sending this month's")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="worker processes of --backfill")
+    args = parser.parse_args()
+    if args.backfill:
+        end = args.end or previous_month(datetime.now())
+        run, run_args = backfill, (args.start or (end[0], 1), end, BACKFILL_DIR, args.workers)
+    else:
+        run, run_args = main, (args.start, args.end, args.all_plots)
+    if args.profile:
+        data = run_profiled(run, args.profile, *run_args)
+    else:
+        data = run(*run_args)
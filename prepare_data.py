@@ -1,22 +1,49 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from functools import lru_cache
+from datetime import datetime, timedelta
 from utils.mongo_utils import *
 from utils.date_utils import *
+from utils.snapshot_utils import load_snapshot, save_snapshot, invalidate_snapshot, query_hash
+from utils.profiling_utils import stage
+from utils.rollup_utils import build_rollup, update_rollup, unsettled_mask
 
-# Cached version of convert_to_est to avoid redundant calculations
-@lru_cache(maxsize=None)
-def convert_to_est_cached(date, is_dst=True):
-    return convert_to_est(date, is_dst)
+# On-disk snapshot of prepared rows shared by daily_stats, monthly_stats and the dashboard
+SNAPSHOT_PATH = os.getenv("PREPARED_SNAPSHOT_PATH", os.path.join("files", "prepared_snapshot.parquet"))
+# Bumped whenever the derived columns change so older snapshots are rebuilt
+SNAPSHOT_VERSION = 4
+# Seconds a snapshot is reused as-is before Mongo is queried again (0 disables the cache)
+CACHE_TTL = int(os.getenv("PREPARED_CACHE_TTL", "1800"))
+# Monthly rollup kept in step with the snapshot (see refresh_rollup)
+ROLLUP_PATH = os.getenv("PREPARED_ROLLUP_PATH", os.path.join("files", "monthly_rollup.parquet"))
+# Bumped whenever the rollup measures change so older rollups are rebuilt
+ROLLUP_VERSION = 1
+# Worker processes for the per-row pipeline (1 runs it serially)
+WORKERS = int(os.getenv("PREPARE_WORKERS", "1"))
 
-# Function to set datetime objects and filter dates
+# SKUs and SKU types left out of the daily and monthly reports
+EXCLUDED_SKU_TYPES = ["DNA_METHYLATION", "CORTISOL"]
+EXCLUDED_SKUS = ["quantify_microtainer_collection_kit"]
+
+# (mongo event flag, mongo event diff, derived date column, derived days-since column)
+EVENT_NAMES = [
+    ("kitInTransit", "kitInTransitDiff", "kitInTransitDate", "daysSinceKitInTransit"),
+    ("kitDelivered", "kitDeliveredDiff", "kitDeliveredDate", "daysSinceKitDelivered"),
+    ("kitRegistered", "kitRegisteredDiff", "registeredDate", "daysSinceRegistered"),
+    ("sampleInTransit", "sampleInTransitDiff", "droppedOffDate", "daysSinceTransit"),
+    ("sampleDelivered", "sampleDeliveredDiff", "deliveredDate", "daysSinceDelivered"),
+    ("sampleReceived", "sampleReceivedDiff", "receivedDate", "daysSinceReceived"),
+    ("sampleResulted", "sampleResultedDiff", "resultedDate", "daysSinceResulted"),
+    ("sampleRejected", "sampleRejectedDiff", "rejectedDate", "daysSinceRejected"),
+    ("orderPublished", "orderPublishedDiff", "publishedDate", "daysSincePublished"),
+]
+
+# Function to set datetime objects and convert them from UTC to Eastern time
 def set_dates(df):
-    df["lastUpdatedDate"] = pd.to_datetime(df["lastUpdatedDate"]).apply(
-        lambda x: convert_to_est_cached(x, is_dst=True)
-    )
-    df["createdDate"] = pd.to_datetime(df["createdDate"]).apply(
-        lambda x: convert_to_est_cached(x, is_dst=True)
-    )
+    df["lastUpdatedDate"] = convert_to_est_vectorized(df["lastUpdatedDate"])
+    df["createdDate"] = convert_to_est_vectorized(df["createdDate"])
     return df
 
 # Function to filter DataFrame based on specific criteria
@@ -35,74 +62,343 @@ def filter_vals(df):
     )
     return data
 
-# Function to apply various calculations and transformations to the DataFrame
+# Function to drop the SKUs excluded from the daily and monthly reports
+def filter_skus(df):
+    df = df[~df["spotSkuType"].isin(EXCLUDED_SKU_TYPES)]
+    df = df[~df["spotSku"].isin(EXCLUDED_SKUS)]
+    return df
+
+# Mongo filter selecting the same documents as filter_vals (and filter_skus when
+# exclude_skus is set), so they can be discarded server side
+def build_query(exclude_skus=False):
+    query = {
+        "$or": [{"sampleDelivered": True}, {"sampleReceived": True}],
+        "sampleCollectionException": False,
+        "sampleDeliveryException": False,
+        "sampleCanceled": False,
+        "kitCanceled": False,
+    }
+    if exclude_skus:
+        query["spotSkuType"] = {"$nin": EXCLUDED_SKU_TYPES}
+        query["spotSku"] = {"$nin": EXCLUDED_SKUS}
+    return query
+
+# Truthiness of a flag column as seen by `pd.notna(x) and x`
+def _is_truthy(flags):
+    return flags.fillna(False).astype(bool)
+
+# Column-wise equivalent of chaining `a or b or ...`: first non-missing, non-zero value
+def _first_truthy(*columns):
+    result = columns[-1]
+    for column in reversed(columns[:-1]):
+        result = column.where(column.notna() & (column != 0), result)
+    return result
+
+# Days after createdDate at which an event happened, NaN if it has not happened
+def _event_diff(df, mongo_event_name, mongo_event_diff):
+    has_event = _is_truthy(df[mongo_event_name]) & df[mongo_event_diff].notna()
+    return df[mongo_event_diff].where(has_event)
+
+# Whether the sample is overdue (more than 5 business days from drop-off) as of `today`
+def _breaks_guarantee(df, today, calendar=None):
+    dropped_off = df["droppedOffDate"].notna()
+    # a missing flag counts as resulted, like `not NaN` did in the row-wise version
+    not_resulted = ~df["sampleResulted"].fillna(True).astype(bool)
+    overdue_now = calc_diff_days2_vectorized(df["droppedOffDate"], today, calendar) > 5.0
+    overdue_published = df["totalProcessingTime"] > 5.0
+    return np.where(dropped_off & not_resulted, overdue_now, dropped_off & overdue_published)
+
+# Function to apply the calculations that depend only on the data (see as_of for the rest)
 def apply_functions(df):
-    event_names = [
-        ("kitInTransit", "kitInTransitDiff", "kitInTransitDate", "daysSinceKitInTransit"),
-        ("kitDelivered", "kitDeliveredDiff", "kitDeliveredDate", "daysSinceKitDelivered"),
-        ("kitRegistered", "kitRegisteredDiff", "registeredDate", "daysSinceRegistered"),
-        ("sampleInTransit", "sampleInTransitDiff", "droppedOffDate", "daysSinceTransit"),
-        ("sampleDelivered", "sampleDeliveredDiff", "deliveredDate", "daysSinceDelivered"),
-        ("sampleReceived", "sampleReceivedDiff", "receivedDate", "daysSinceReceived"),
-        ("sampleResulted", "sampleResultedDiff", "resultedDate", "daysSinceResulted"),
-        ("sampleRejected", "sampleRejectedDiff", "rejectedDate", "daysSinceRejected"),
-        ("orderPublished", "orderPublishedDiff", "publishedDate", "daysSincePublished"),
-    ]
+    calendar = calendar_for_dates(df["createdDate"])
 
-    # Calculate date differences and update date columns
-    for mongo_event_name, mongo_event_diff, event_date, event_days_diff in event_names:
-        df[event_days_diff] = df.apply(
-            lambda row: calc_diff_days(row["createdDate"], row[mongo_event_diff])
-            if pd.notna(row[mongo_event_name]) and row[mongo_event_name] and pd.notna(row[mongo_event_diff])
-            else None, axis=1
-        )
-        df[event_date] = df.apply(
-            lambda row: date_updated(row["createdDate"], row[mongo_event_diff])
-            if pd.notna(row[mongo_event_name]) and row[mongo_event_name] and pd.notna(row[mongo_event_diff])
-            else None, axis=1
-        )
-
-    df["targetDate"] = df["droppedOffDate"].apply(
-        lambda x: date_updated(x, 5.0) if pd.notna(x) else None
-    )
+    # Update date columns
+    for mongo_event_name, mongo_event_diff, event_date, _ in EVENT_NAMES:
+        event_diff = _event_diff(df, mongo_event_name, mongo_event_diff)
+        df[event_date] = date_updated_vectorized(df["createdDate"], event_diff).astype("datetime64[ns]")
+
+    df["targetDate"] = df["droppedOffDate"] + timedelta(days=5.0)
 
-    # Helper function to calculate time differences
-    def calculate_times(row, start_col, end_col):
-        return calc_diff_days2(row[start_col], row[end_col]) if pd.notna(row[start_col]) and pd.notna(row[end_col]) else None
+    # Helper function to calculate time differences, NaN where either date is missing
+    def calculate_times(start_col, end_col):
+        return pd.Series(calc_diff_days2_vectorized(df[start_col], df[end_col], calendar), index=df.index)
 
     # Calculate various processing times
-    df["kitShippingTime"] = df.apply(lambda row: calculate_times(row, "kitInTransitDate", "kitDeliveredDate"), axis=1)
-    df["shippingTime"] = df.apply(lambda row: calculate_times(row, "droppedOffDate", "deliveredDate") or calculate_times(row, "droppedOffDate", "receivedDate"), axis=1)
-    df["labProcessingTime"] = df.apply(lambda row: calculate_times(row, "deliveredDate", "resultedDate") or calculate_times(row, "deliveredDate", "rejectedDate") or calculate_times(row, "receivedDate", "resultedDate") or calculate_times(row, "receivedDate", "rejectedDate"), axis=1)
-    df["reportPublishingTime"] = df.apply(lambda row: calculate_times(row, "resultedDate", "publishedDate"), axis=1)
-    df["totalProcessingTime"] = df.apply(lambda row: calculate_times(row, "droppedOffDate", "publishedDate"), axis=1)
-
-    # Determine if the sample is overdue
-    df["breaksGuarantee"] = df.apply(
-        lambda row: (calc_diff_days2(row["droppedOffDate"], datetime.today()) > 5.0)
-        if pd.notna(row["droppedOffDate"]) and not row["sampleResulted"]
-        else (calc_diff_days2(row["droppedOffDate"], row["publishedDate"]) > 5.0)
-        if pd.notna(row["droppedOffDate"]) and pd.notna(row["publishedDate"])
-        else False, axis=1
+    df["kitShippingTime"] = calculate_times("kitInTransitDate", "kitDeliveredDate")
+    df["shippingTime"] = _first_truthy(
+        calculate_times("droppedOffDate", "deliveredDate"),
+        calculate_times("droppedOffDate", "receivedDate"),
     )
+    df["labProcessingTime"] = _first_truthy(
+        calculate_times("deliveredDate", "resultedDate"),
+        calculate_times("deliveredDate", "rejectedDate"),
+        calculate_times("receivedDate", "resultedDate"),
+        calculate_times("receivedDate", "rejectedDate"),
+    )
+    df["reportPublishingTime"] = calculate_times("resultedDate", "publishedDate")
+    df["totalProcessingTime"] = calculate_times("droppedOffDate", "publishedDate")
 
     return df
 
+# Function to compute the clock-dependent columns of a base frame as of `ts` (default now),
+# then round and sort it like the reports expect. The base frame itself is left untouched.
+def as_of(base, ts=None):
+    if ts is None:
+        ts = datetime.now()
+    with stage("as_of", rows=len(base)):
+        df = base.copy()
+        calendar = calendar_for_dates(df["createdDate"], ts)
+
+        # Business days since each event
+        for mongo_event_name, mongo_event_diff, _, event_days_diff in EVENT_NAMES:
+            event_diff = _event_diff(df, mongo_event_name, mongo_event_diff)
+            df[event_days_diff] = calc_diff_days_vectorized(df["createdDate"], event_diff, calendar, ts)
+
+        # Determine if the sample is overdue
+        df["breaksGuarantee"] = _breaks_guarantee(df, ts, calendar)
+
+    with stage("clean_lab_data", rows=len(df)):
+        df = clean_lab_data(df)
+        return apply_schema(df)
+
+# Compact dtypes of the prepared frame
+CATEGORY_COLUMNS = ["businessKey", "country", "spotSku", "spotSkuType"]
+STRING_COLUMNS = ["sampleID", "orderID"]
+NULLABLE_BOOLEAN_COLUMNS = [event[0] for event in EVENT_NAMES] + [
+    "sampleCollectionException", "sampleDeliveryException", "sampleCanceled", "kitCanceled",
+    "sampleProcessed",
+]
+BOOLEAN_COLUMNS = ["collectionRecorded", "receivedOnTime", "breaksGuarantee"]
+DURATION_COLUMNS = [event[3] for event in EVENT_NAMES] + [
+    "kitShippingTime", "shippingTime", "labProcessingTime", "reportPublishingTime",
+    "totalProcessingTime",
+]
+DATE_COLUMNS = ["lastUpdatedDate", "createdDate", "targetDate"] + [event[2] for event in EVENT_NAMES]
+
+# Function to cast the prepared frame to its compact schema: categoricals for low-cardinality
+# keys, Arrow-backed strings for IDs, (nullable) booleans for flags, float32 for durations.
+# The raw *Diff offsets stay float64 because event dates are derived from them.
+def apply_schema(df):
+    dtypes = {}
+    dtypes.update({col: "category" for col in CATEGORY_COLUMNS})
+    dtypes.update({col: "string[pyarrow]" for col in STRING_COLUMNS})
+    dtypes.update({col: "boolean" for col in NULLABLE_BOOLEAN_COLUMNS})
+    dtypes.update({col: bool for col in BOOLEAN_COLUMNS})
+    dtypes.update({col: "float32" for col in DURATION_COLUMNS})
+    dtypes.update({col: "datetime64[ns]" for col in DATE_COLUMNS})
+    return df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+
+# Function to report the memory used by each column of a DataFrame, largest first
+def memory_report(df):
+    usage = df.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        "dtype": df.dtypes.astype(str),
+        "MiB": (usage / 1024 ** 2).round(3),
+    }).sort_values("MiB", ascending=False)
+    report.loc["TOTAL"] = ["", round(usage.sum() / 1024 ** 2, 3)]
+    return report
+
 # Function to clean and sort lab data
 def clean_lab_data(in_lab):
     for col in in_lab.columns:
         if "date" in col.lower():
-            in_lab[col] = pd.to_datetime(in_lab[col]).dt.round("min")
+            dates = in_lab[col]
+            if not pd.api.types.is_datetime64_dtype(dates):
+                dates = pd.to_datetime(dates)
+            in_lab[col] = dates.dt.round("min")
 
     return in_lab.sort_values(by="lastUpdatedDate", ascending=False)
 
-# Main function to prepare data
-def prepare_data():
-    client = connect_mongo()
-    docs = pull_mongo_data(client)
-    df = pd.DataFrame(docs)
-    df = set_dates(df)
-    data = filter_vals(df)
-    data = apply_functions(data)
-    data = clean_lab_data(data)
+# Run the per-row pipeline over the raw Mongo frame (dates are left unrounded)
+def _prepare_serial(df, exclude_skus=False):
+    with stage("set_dates", rows=len(df)):
+        df = set_dates(df)
+    with stage("filter_vals") as record:
+        data = filter_vals(df)
+        if exclude_skus:
+            data = filter_skus(data)
+        record["rows"] = len(data)
+    with stage("apply_functions", rows=len(data)):
+        data = apply_functions(data)
     return data
+
+# Process pool task: one partition through the serial pipeline, with the CPU time it took
+def _prepare_partition(df, exclude_skus):
+    start = time.process_time()
+    data = _prepare_serial(df, exclude_skus)
+    return data, time.process_time() - start
+
+# Run the per-row pipeline, in `workers` processes over createdDate-month partitions if
+# workers > 1. Every step keeps the index of the rows it keeps, so sorting the concatenated
+# partitions by index gives back exactly the serial result.
+def _prepare_frame(df, exclude_skus=False, workers=1):
+    if workers <= 1 or df.empty:
+        return _prepare_serial(df, exclude_skus)
+    months = pd.to_datetime(df["createdDate"]).dt.to_period("M")
+    partitions = [part for _, part in df.groupby(months, sort=True, dropna=False)]
+    if len(partitions) <= 1:
+        return _prepare_serial(df, exclude_skus)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_prepare_partition, partitions, [exclude_skus] * len(partitions)))
+    data = pd.concat([part for part, _ in results]).sort_index()
+    elapsed = time.perf_counter() - start
+
+    # how busy the workers were, not a speedup over serial mode (see benchmarks --workers)
+    cpu_time = sum(seconds for _, seconds in results)
+    print(
+        f"Prepared {len(df)} rows in {len(partitions)} partitions on {workers} workers: "
+        f"{elapsed:.2f}s wall for {cpu_time:.2f}s of pipeline CPU time ({cpu_time / elapsed:.1f}x CPU utilisation)"
+    )
+    return data
+
+# Newest lastUpdatedDate in the raw frame, in Mongo's own (UTC) time
+def _max_last_updated(df, default=None):
+    last_updated = df["lastUpdatedDate"].max()
+    return default if pd.isna(last_updated) else last_updated.to_pydatetime()
+
+# Load the shared snapshot, refreshing it from Mongo once it is older than `ttl` seconds.
+# A stale snapshot is either rebuilt or, with `incremental`, brought up to date with the
+# documents changed since its watermark: changed documents replace their previous rows by
+# sampleID (including rows that no longer pass the filters, which is why the delta pull is
+# not filtered server side) and untouched rows are kept as they are. Documents deleted from
+# Mongo are not detected by the incremental path. A snapshot without a watermark is rebuilt,
+# and nothing is saved when nothing was pulled (Mongo unavailable or an empty result), so an
+# empty pull never pins the later incremental runs to an empty snapshot.
+def _load_snapshot_base(client, snapshot_path, ttl, incremental, workers=1, rollup_path=None, as_of_ts=None):
+    query = build_query()
+    expected_hash = query_hash(query, PROJECTION, SNAPSHOT_VERSION)
+    with stage("snapshot.load") as record:
+        snapshot, metadata = load_snapshot(snapshot_path, expected_hash)
+        record["rows"] = None if snapshot is None else len(snapshot)
+    if snapshot is not None and 0 <= (datetime.now() - metadata["created"]).total_seconds() < ttl:
+        if rollup_path:
+            _maintain_rollup(rollup_path, snapshot, metadata["created"], as_of_ts, snapshot, metadata["created"])
+        return snapshot
+
+    if client is None:
+        client = connect_mongo()
+    if client is None and snapshot is not None:
+        # keep serving the last snapshot rather than overwriting it with an empty pull
+        print(f"MongoDB unavailable, using the snapshot from {metadata['created']}")
+        if rollup_path:
+            _maintain_rollup(rollup_path, snapshot, metadata["created"], as_of_ts, snapshot, metadata["created"])
+        return snapshot
+    if snapshot is None or not incremental or metadata["watermark"] is None:
+        df = pull_mongo_frame(client, query)
+        watermark = _max_last_updated(df)
+        data = _prepare_frame(df, workers=workers)
+        previous = previous_created = None
+    else:
+        df = pull_mongo_frame(client, {"lastUpdatedDate": {"$gte": metadata["watermark"]}})
+        watermark = _max_last_updated(df, metadata["watermark"])
+        data = snapshot[~snapshot["sampleID"].isin(df["sampleID"])]
+        if not df.empty:
+            data = pd.concat([data, _prepare_frame(df, workers=workers)], ignore_index=True)
+        previous, previous_created = snapshot, metadata["created"]
+
+    data = apply_schema(data)
+    if client is None or watermark is None:
+        print("No documents pulled from MongoDB, the snapshot is not saved")
+        return data
+    with stage("snapshot.save", rows=len(data)):
+        saved = save_snapshot(data, snapshot_path, watermark, expected_hash)
+    if rollup_path:
+        _maintain_rollup(rollup_path, data, saved["created"], as_of_ts, previous, previous_created, df["sampleID"])
+    return data
+
+# Hash identifying the rollups built by this version of the pipeline, over every SKU or
+# (exclude_skus) without the excluded ones
+def _rollup_hash(exclude_skus=False):
+    return query_hash(build_query(exclude_skus), PROJECTION, [SNAPSHOT_VERSION, ROLLUP_VERSION])
+
+# Load the persisted rollup and its metadata (as_of, unsettled sampleIDs, base_created),
+# or (None, None) if there is none for this pipeline version and SKU selection
+def load_rollup(rollup_path=ROLLUP_PATH, exclude_skus=False):
+    rollup, metadata = load_snapshot(rollup_path, _rollup_hash(exclude_skus))
+    if metadata is not None:
+        metadata["as_of"] = datetime.fromisoformat(metadata["as_of"])
+    return rollup, metadata
+
+# Function to bring a rollup of `previous` (as of metadata["as_of"]) to the rows of `base`
+# as of `ts`, where only the rows of `changed_ids` differ between the two frames. Besides
+# those, only the unsettled rows (see unsettled_mask) can contribute differently, so both
+# sets are subtracted as they were and added as they are now; the rest of the history is
+# not touched. Without a rollup it is built from all of `base`. A rollup is never moved back
+# in time: a `ts` before metadata["as_of"] is taken as metadata["as_of"].
+def refresh_rollup(rollup, metadata, base, ts=None, previous=None, changed_ids=()):
+    if ts is None:
+        ts = datetime.now()
+    if rollup is not None:
+        ts = max(ts, metadata["as_of"])
+        if ts == metadata["as_of"] and not len(changed_ids):
+            return rollup, metadata
+    if rollup is None:
+        df = as_of(base, ts)
+        rollup = build_rollup(df)
+        unsettled = df["sampleID"][unsettled_mask(df)]
+    else:
+        if previous is None:
+            previous = base
+        ids = pd.Index(changed_ids).union(pd.Index(metadata["unsettled"]))
+        removed = as_of(previous[previous["sampleID"].isin(ids)], metadata["as_of"])
+        added = as_of(base[base["sampleID"].isin(ids)], ts)
+        rollup = update_rollup(rollup, removed, added)
+        unsettled = added["sampleID"][unsettled_mask(added)]
+    return rollup, {"as_of": ts, "unsettled": unsettled.tolist()}
+
+# Refresh the persisted rollup after the snapshot moved from `previous` to `base`. The
+# rollup is rebuilt when it was not made from `previous` (e.g. another snapshot was written
+# without rollup maintenance in between, or over another SKU selection).
+def _maintain_rollup(rollup_path, base, base_created, ts, previous=None, previous_created=None, changed_ids=(), exclude_skus=False):
+    with stage("rollup.refresh") as record:
+        rollup, metadata = load_rollup(rollup_path, exclude_skus)
+        if rollup is None or previous is None or previous_created is None or metadata["base_created"] != previous_created.isoformat():
+            rollup = metadata = previous = None
+        rollup, metadata = refresh_rollup(rollup, metadata, base, ts, previous, changed_ids)
+        record["rows"] = len(rollup)
+        record["unsettled"] = len(metadata["unsettled"])
+        save_snapshot(rollup, rollup_path, None, _rollup_hash(exclude_skus), {
+            "as_of": metadata["as_of"].isoformat(),
+            "unsettled": metadata["unsettled"],
+            "base_created": base_created.isoformat() if base_created is not None else None,
+        })
+
+# Delete the shared snapshot so the next prepare_data() call rebuilds it from Mongo
+def invalidate_cache(snapshot_path=SNAPSHOT_PATH):
+    invalidate_snapshot(snapshot_path)
+
+# Function to prepare the time-invariant base frame (no clock-dependent columns, dates not
+# rounded yet). exclude_skus also drops the SKUs the reports leave out. Unless ttl is 0, the
+# rows come from the shared on-disk snapshot, which always holds every SKU so all entry
+# points can reuse it; the SKU exclusion is then applied locally. A rollup built with ttl 0
+# covers the rows pulled, so load_rollup only returns it for the same exclude_skus. With
+# workers > 1 the per-row pipeline runs in a process pool.
+def prepare_base(incremental=False, snapshot_path=SNAPSHOT_PATH, client=None, exclude_skus=False, ttl=CACHE_TTL, workers=WORKERS, rollup_path=None, as_of_ts=None):
+    if ttl > 0 or incremental:
+        data = _load_snapshot_base(client, snapshot_path, ttl, incremental, workers, rollup_path, as_of_ts)
+        if exclude_skus:
+            data = filter_skus(data)
+    else:
+        if client is None:
+            client = connect_mongo()
+        df = pull_mongo_frame(client, build_query(exclude_skus))
+        data = apply_schema(_prepare_frame(df, exclude_skus, workers))
+        if rollup_path:
+            _maintain_rollup(rollup_path, data, None, as_of_ts, exclude_skus=exclude_skus)
+    return data
+
+# Function to prepare a frame of changed documents (from documents_to_frame) into base rows,
+# like the snapshot rows, e.g. to apply a change stream without reloading everything
+def prepare_documents(df, exclude_skus=False):
+    return apply_schema(_prepare_frame(df, exclude_skus))
+
+# Main function to prepare data: the base frame with its clock-dependent columns computed
+# as of `as_of_ts` (default now), so a report can be regenerated for any point in time.
+# With rollup_path, the rollup stored there is brought up to date as of the same time.
+def prepare_data(incremental=False, snapshot_path=SNAPSHOT_PATH, client=None, exclude_skus=False, ttl=CACHE_TTL, as_of_ts=None, workers=WORKERS, rollup_path=None):
+    if as_of_ts is None:
+        as_of_ts = datetime.now()
+    base = prepare_base(incremental, snapshot_path, client, exclude_skus, ttl, workers, rollup_path, as_of_ts)
+    return as_of(base, as_of_ts)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import mongomock
+import pytest
+
+# The tests import the entry-point modules from the repository root, without the stage logs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STAGE_LOG", "off")
+
+from benchmarks.generate_data import generate_documents
+
+
+def make_client(n=2000, seed=0):
+    """A mongomock client whose spot-history-statuses holds `n` synthetic documents."""
+    client = mongomock.MongoClient()
+    if n:
+        client["quantify"]["spot-history-statuses"].insert_many(list(generate_documents(n, seed)))
+    return client
+
+@pytest.fixture
+def client():
+    return make_client()
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pandas as pd
+
+from utils.aging_utils import aging_band, band_labels, days_overdue, in_lab_counts
+
+# Midnight, so the drop-offs below are a whole number of business days overdue (Monday
+# 2025-01-20 is a holiday)
+TODAY = datetime(2025, 1, 31)
+
+
+def _in_lab(dropped_off, overdue):
+    return pd.DataFrame({
+        "sampleID": [f"s-{i}" for i in range(len(dropped_off))],
+        "droppedOffDate": pd.to_datetime(dropped_off),
+        "breaksGuarantee": overdue,
+    })
+
+def test_aging_band_edges():
+    in_lab = _in_lab(["2025-01-22", "2025-01-21", "2025-01-14", "2025-01-13", "2025-01-02"], True)
+    assert days_overdue(in_lab, TODAY).tolist() == [6.0, 7.0, 11.0, 12.0, 19.0]
+    assert band_labels() == ["<7", "<12", ">=12"]
+    # a sample moves to the next band on the day it reaches the edge
+    assert aging_band(in_lab, TODAY).tolist() == [0, 1, 1, 2, 2]
+    assert aging_band(in_lab, TODAY, edges=[7.0]).tolist() == [0, 1, 1, 1, 1]
+    assert band_labels([7.0]) == ["<7", ">=7"]
+
+def test_aging_band_is_only_given_to_overdue_samples():
+    in_lab = _in_lab(["2025-01-13", "2025-01-13", "2025-01-13"], [True, False, None])
+    assert aging_band(in_lab, TODAY).tolist() == [2, -1, -1]
+
+def test_in_lab_counts_per_band():
+    in_lab = _in_lab(["2025-01-22", "2025-01-21", "2025-01-13", "2025-01-29"], [True, True, True, False])
+    in_lab = in_lab.assign(sampleDelivered=True, sampleReceived=True, daysSinceReceived=[1.0, 2.0, 3.0, None])
+    counts = in_lab_counts(in_lab, TODAY)
+    assert counts["overdue"] == 3
+    assert counts["overdue_bands"] == {"<7": 1, "<12": 1, ">=12": 1}
+    assert (counts["less_than_two_days"], counts["two_or_more_days"]) == (1, 2)
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pandas as pd
+
+import prepare_data
+from benchmarks.generate_data import generate_frame
+from utils import date_utils
+from utils.date_utils import calc_diff_days, calc_diff_days2, date_updated
+
+NOW = datetime(2025, 1, 15, 12, 0)
+
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+# The row-wise apply_functions the columnar one replaced, as of NOW
+def rowwise_apply_functions(df):
+    for mongo_event_name, mongo_event_diff, event_date, event_days_diff in prepare_data.EVENT_NAMES:
+        df[event_days_diff] = df.apply(
+            lambda row: calc_diff_days(row["createdDate"], row[mongo_event_diff])
+            if pd.notna(row[mongo_event_name]) and row[mongo_event_name] and pd.notna(row[mongo_event_diff])
+            else None, axis=1
+        )
+        df[event_date] = df.apply(
+            lambda row: date_updated(row["createdDate"], row[mongo_event_diff])
+            if pd.notna(row[mongo_event_name]) and row[mongo_event_name] and pd.notna(row[mongo_event_diff])
+            else None, axis=1
+        )
+
+    df["targetDate"] = df["droppedOffDate"].apply(lambda x: date_updated(x, 5.0) if pd.notna(x) else None)
+
+    def calculate_times(row, start_col, end_col):
+        return calc_diff_days2(row[start_col], row[end_col]) if pd.notna(row[start_col]) and pd.notna(row[end_col]) else None
+
+    df["kitShippingTime"] = df.apply(lambda row: calculate_times(row, "kitInTransitDate", "kitDeliveredDate"), axis=1)
+    df["shippingTime"] = df.apply(lambda row: calculate_times(row, "droppedOffDate", "deliveredDate") or calculate_times(row, "droppedOffDate", "receivedDate"), axis=1)
+    df["labProcessingTime"] = df.apply(lambda row: calculate_times(row, "deliveredDate", "resultedDate") or calculate_times(row, "deliveredDate", "rejectedDate") or calculate_times(row, "receivedDate", "resultedDate") or calculate_times(row, "receivedDate", "rejectedDate"), axis=1)
+    df["reportPublishingTime"] = df.apply(lambda row: calculate_times(row, "resultedDate", "publishedDate"), axis=1)
+    df["totalProcessingTime"] = df.apply(lambda row: calculate_times(row, "droppedOffDate", "publishedDate"), axis=1)
+
+    df["breaksGuarantee"] = df.apply(
+        lambda row: (calc_diff_days2(row["droppedOffDate"], NOW) > 5.0)
+        if pd.notna(row["droppedOffDate"]) and not row["sampleResulted"]
+        else (calc_diff_days2(row["droppedOffDate"], row["publishedDate"]) > 5.0)
+        if pd.notna(row["droppedOffDate"]) and pd.notna(row["publishedDate"])
+        else False, axis=1
+    )
+    return df
+
+def test_columnar_apply_functions_matches_rowwise(monkeypatch):
+    monkeypatch.setattr(date_utils, "datetime", FixedDatetime)
+    filtered = prepare_data.filter_vals(prepare_data.set_dates(generate_frame(600, seed=3)))
+
+    expected = prepare_data.clean_lab_data(rowwise_apply_functions(filtered.copy()))
+    # the columnar version leaves the clock-dependent columns to as_of
+    got = prepare_data.as_of(prepare_data.apply_functions(filtered.copy()), NOW)
+    pd.testing.assert_frame_equal(
+        prepare_data.apply_schema(expected),
+        got[expected.columns],
+    )
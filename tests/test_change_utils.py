@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from utils.change_utils import latest_update, poll_changes
+
+
+def _document(client, sample_id, updated):
+    client["quantify"]["spot-history-statuses"].insert_one({"sampleID": sample_id, "lastUpdatedDate": updated})
+
+def _ids(batch):
+    return sorted(document["sampleID"] for document in batch)
+
+def test_polls_yield_each_change_once(client):
+    since = latest_update(client)
+    polls = poll_changes(client, since, interval=0)
+    assert [document["lastUpdatedDate"] for document in next(polls)] == [since]
+    assert next(polls) == []
+
+    later = since + timedelta(minutes=1)
+    _document(client, "new-1", later)
+    assert _ids(next(polls)) == ["new-1"]
+    _document(client, "new-2", later)
+    assert _ids(next(polls)) == ["new-2"]
+    assert next(polls) == []
+
+def test_polling_without_watermark_starts_from_now(client):
+    polls = poll_changes(client, None, interval=0)
+    assert len(next(polls)) == 1
+    assert next(polls) == []
+    _document(client, "new", datetime(2100, 1, 1))
+    assert _ids(next(polls)) == ["new"]
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import date_utils
+from utils.date_utils import (
+    calc_diff_days, calc_diff_days2, calc_diff_days2_vectorized, calc_diff_days_vectorized,
+    convert_to_est_vectorized, date_updated, date_updated_vectorized,
+)
+
+NOW = datetime(2024, 11, 29, 15, 30)  # the Friday after Thanksgiving
+
+# (start, end): weekday, weekend and holiday endpoints, reversed dates and the March 2024 DST change
+PAIRS = [
+    (datetime(2024, 11, 25, 9, 15), datetime(2024, 11, 27, 17, 45)),
+    (datetime(2024, 11, 22, 23, 59), datetime(2024, 11, 25, 0, 1)),      # Friday to Monday
+    (datetime(2024, 11, 23, 10, 0), datetime(2024, 11, 24, 12, 0)),      # Saturday to Sunday
+    (datetime(2024, 11, 27, 8, 0), datetime(2024, 11, 28, 18, 0)),       # into Thanksgiving
+    (datetime(2024, 11, 28, 8, 0), datetime(2024, 12, 2, 6, 30)),        # from Thanksgiving
+    (datetime(2024, 12, 24, 12, 0), datetime(2025, 1, 2, 9, 0)),         # Christmas and New Year
+    (datetime(2024, 11, 27, 17, 45), datetime(2024, 11, 25, 9, 15)),     # reversed
+    (datetime(2024, 12, 2, 6, 30), datetime(2024, 11, 28, 8, 0)),        # reversed over a holiday
+    (datetime(2024, 3, 8, 22, 0), datetime(2024, 3, 11, 3, 30)),         # over the DST change
+    (datetime(2024, 5, 6, 10, 0), datetime(2024, 5, 6, 16, 0)),          # same day
+]
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+@pytest.fixture
+def fixed_now(monkeypatch):
+    monkeypatch.setattr(date_utils, "datetime", FixedDatetime)
+
+def test_calc_diff_days2_vectorized_matches_scalar():
+    starts = pd.Series([start for start, _ in PAIRS] + [pd.NaT, PAIRS[0][0]])
+    ends = pd.Series([end for _, end in PAIRS] + [PAIRS[0][1], pd.NaT])
+    expected = [calc_diff_days2(start, end) for start, end in PAIRS] + [np.nan, np.nan]
+    np.testing.assert_array_equal(calc_diff_days2_vectorized(starts, ends), expected)
+
+def test_calc_diff_days2_vectorized_with_a_scalar_end():
+    starts = pd.Series([start for start, _ in PAIRS])
+    expected = [calc_diff_days2(start, NOW) for start, _ in PAIRS]
+    np.testing.assert_array_equal(calc_diff_days2_vectorized(starts, NOW), expected)
+
+def test_date_updated_vectorized_matches_scalar():
+    starts = pd.Series([start for start, _ in PAIRS])
+    days = np.array([0.0, 0.5, 1.25, 2.999999, 3.1234567, 7.0, 0.0000001, 10.333, 1.5, 4.75])
+    expected = np.array([date_updated(start, day) for start, day in zip(starts, days)], dtype="datetime64[us]")
+    np.testing.assert_array_equal(date_updated_vectorized(starts, days), expected)
+    assert np.isnat(date_updated_vectorized(starts[:1], [np.nan])).all()
+
+def test_calc_diff_days_vectorized_matches_scalar(fixed_now):
+    starts = pd.Series([start for start, _ in PAIRS] + [PAIRS[0][0]])
+    days = np.array([0.0, 0.5, 1.25, 2.999999, 3.1234567, 7.0, 0.0000001, 10.333, 1.5, 4.75, np.nan])
+    expected = [calc_diff_days(start, day) for start, day in zip(starts[:-1], days[:-1])] + [np.nan]
+    np.testing.assert_array_equal(calc_diff_days_vectorized(starts, days, now=NOW), expected)
+
+def test_convert_to_est_follows_dst():
+    utc = pd.Series(pd.to_datetime([
+        "2024-03-10 06:59", "2024-03-10 07:00",   # 01:59 EST, then 03:00 EDT
+        "2024-11-03 05:59", "2024-11-03 06:00",   # 01:59 EDT, then 01:00 EST
+        None,
+    ]))
+    expected = pd.Series(pd.to_datetime([
+        "2024-03-10 01:59", "2024-03-10 03:00", "2024-11-03 01:59", "2024-11-03 01:00", None,
+    ]))
+    pd.testing.assert_series_equal(convert_to_est_vectorized(utc), expected)
+
+def test_calc_diff_days2_vectorized_matches_scalar_on_random_dates():
+    rng = np.random.default_rng(0)
+    base = np.datetime64("2023-11-01T00:00", "us")
+    span = 400 * 86400 * 1000000
+    starts = pd.Series(base + rng.integers(0, span, 2000).astype("timedelta64[us]"))
+    # up to 10 days backwards (reversed dates) and 40 days forwards, to the second
+    ends = pd.Series(starts.to_numpy() + rng.integers(-10 * 86400, 40 * 86400, 2000).astype("timedelta64[s]"))
+    expected = [calc_diff_days2(start.to_pydatetime(), end.to_pydatetime()) for start, end in zip(starts, ends)]
+    np.testing.assert_array_equal(calc_diff_days2_vectorized(starts, ends), expected)
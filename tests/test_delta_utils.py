@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import daily_stats
+import prepare_data
+from conftest import make_client
+from utils.delta_utils import in_lab_deltas, in_lab_snapshot
+
+YESTERDAY = datetime(2025, 1, 14, 9, 0)
+TODAY = datetime(2025, 1, 15, 9, 0)
+
+# In-lab rows of `samples`, (sampleID, dropped off, breaks guarantee), delivered and received
+def _in_lab(samples):
+    ids, dropped_off, overdue = zip(*samples)
+    return pd.DataFrame({
+        "sampleID": list(ids),
+        "droppedOffDate": pd.to_datetime(list(dropped_off)),
+        "sampleDelivered": True,
+        "sampleReceived": True,
+        "breaksGuarantee": list(overdue),
+    })
+
+def test_in_lab_deltas_between_two_snapshots():
+    early, late = datetime(2024, 12, 20, 9, 0), datetime(2025, 1, 10, 9, 0)
+    previous = in_lab_snapshot(_in_lab([
+        ("waiting", late, False),
+        ("overdue-now", late, False),
+        ("overdue", early, True),
+        ("resulted", early, True),
+        ("rejected", late, False),
+        ("gone", late, False),
+    ]), YESTERDAY)
+    current = in_lab_snapshot(_in_lab([
+        ("waiting", late, False),
+        ("overdue-now", late, True),
+        ("overdue", early, True),
+        ("new", late, False),
+    ]), TODAY)
+    # the departed samples' status is looked up in the prepared data of the current report
+    df = pd.DataFrame({
+        "sampleID": ["resulted", "rejected", "gone", "waiting"],
+        "sampleResulted": [True, False, False, False],
+        "sampleRejected": [False, True, None, False],
+    })
+
+    deltas, counts = in_lab_deltas(previous, current, df)
+    assert counts == {"arrived": 1, "resulted": 1, "rejected": 1, "newly_overdue": 1, "still_overdue": 1}
+    changes = dict(zip(deltas["sampleID"], deltas["change"]))
+    assert changes == {
+        "new": "arrived", "resulted": "resulted", "rejected": "rejected",
+        "overdue-now": "newly_overdue", "overdue": "still_overdue",
+    }
+
+    deltas = deltas.set_index("sampleID")
+    # departed samples keep their last known flags and band
+    assert deltas.loc["resulted", "breaksGuarantee"] == True
+    assert deltas.loc["resulted", "agingBand"] == deltas.loc["resulted", "agingBand_previous"] == ">=12"
+    assert deltas.loc["overdue-now", "agingBand"] == "<7"
+    assert pd.isna(deltas.loc["overdue-now", "agingBand_previous"])
+    assert deltas.loc["new", "sampleDelivered"] == True
+
+def test_unchanged_snapshots_have_no_deltas():
+    snapshot = in_lab_snapshot(_in_lab([("waiting", datetime(2025, 1, 10, 9, 0), False)]), TODAY)
+    deltas, counts = in_lab_deltas(snapshot, snapshot, pd.DataFrame(columns=["sampleID", "sampleResulted", "sampleRejected"]))
+    assert deltas.empty
+    assert set(counts.values()) == {0}
+
+def test_daily_report_counts_what_changed_since_the_last_one(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "files").mkdir()
+    client = make_client()
+    reported = []
+    monkeypatch.setattr(daily_stats, "prepare_data", lambda **kwargs: prepare_data.prepare_data(client=client, **kwargs))
+    monkeypatch.setattr(daily_stats, "send_slack_message", lambda *args: None)
+    monkeypatch.setattr(daily_stats, "generate_message", lambda in_lab, today, deltas: reported.append(deltas))
+
+    # the last report, then results for one of its samples and a rejection for another, well
+    # within the cache TTL of the prepared snapshot
+    clock = YESTERDAY
+    class Clock(datetime):
+        @classmethod
+        def today(cls):
+            return clock
+    monkeypatch.setattr(daily_stats, "datetime", Clock)
+    in_lab = daily_stats.main()
+    assert len(in_lab) >= 2 and reported == [None]
+
+    collection = client["quantify"]["spot-history-statuses"]
+    updated = max(document["lastUpdatedDate"] for document in collection.find()) + timedelta(minutes=1)
+    resulted, rejected = in_lab["sampleID"].iloc[:2]
+    collection.update_one({"sampleID": resulted}, {"$set": {"sampleResulted": True, "lastUpdatedDate": updated}})
+    collection.update_one({"sampleID": rejected}, {"$set": {"sampleRejected": True, "lastUpdatedDate": updated}})
+
+    clock = TODAY
+    daily_stats.main()
+    assert reported[-1]["since"] == YESTERDAY
+    assert (reported[-1]["resulted"], reported[-1]["rejected"]) == (1, 1)
@@ -0,0 +1,53 @@
+import gzip
+import io
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import prepare_data
+from utils.export_utils import RAW_COLUMNS, export_months, frame_bytes
+
+NOW = datetime(2025, 1, 15, 12, 0)
+PERIODS = [(2024, 11), (2024, 12), (2025, 1), (2025, 6)]
+
+
+@pytest.fixture
+def prepared(client):
+    return prepare_data.as_of(prepare_data.prepare_base(client=client, ttl=0), NOW)
+
+# The rows of a month as the report always selected them: received or rejected in it
+def _month_rows(df, year, month):
+    received = (df["receivedDate"].dt.year == year) & (df["receivedDate"].dt.month == month)
+    rejected = (df["rejectedDate"].dt.year == year) & (df["rejectedDate"].dt.month == month)
+    return df.loc[received | rejected, RAW_COLUMNS].reset_index(drop=True)
+
+def test_export_months_round_trips_as_parquet(tmp_path, prepared):
+    # small chunks, so months span several of them
+    paths = export_months(prepared, PERIODS, directory=str(tmp_path), fmt="parquet", chunk_rows=50)
+    assert sorted(paths) == PERIODS
+    for period in PERIODS[:-1]:
+        expected = _month_rows(prepared, *period)
+        # strings come back with the default storage rather than pyarrow's
+        pd.testing.assert_frame_equal(pd.read_parquet(paths[period]), expected, check_dtype=False)
+    # a month without rows still gets the schema
+    empty = pd.read_parquet(paths[(2025, 6)])
+    assert list(empty.columns) == RAW_COLUMNS and empty.empty
+
+def test_export_months_round_trips_as_csv_gz(tmp_path, prepared):
+    paths = export_months(prepared, PERIODS, directory=str(tmp_path), fmt="csv.gz", chunk_rows=50)
+    for (year, month), path in paths.items():
+        assert path.endswith(f"month_data_raw_{year}-{month:02d}.csv.gz")
+        expected = _month_rows(prepared, year, month).to_csv(index=False)
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as file:
+            assert file.read() == expected
+    assert len(_month_rows(prepared, 2024, 12)) > 0
+
+def test_frame_bytes(prepared):
+    df = prepared[RAW_COLUMNS].reset_index(drop=True)
+    data = frame_bytes(df, fmt="csv.gz", chunk_rows=64)
+    assert gzip.decompress(data).decode("utf-8") == df.to_csv(index=False)
+    # no timestamp in the gzip header: an unchanged export is byte-identical
+    assert frame_bytes(df, fmt="csv.gz", chunk_rows=64) == data
+    parquet = pd.read_parquet(io.BytesIO(frame_bytes(df, fmt="parquet", chunk_rows=64)))
+    pd.testing.assert_frame_equal(parquet, df, check_dtype=False)
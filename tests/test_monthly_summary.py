@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import pandas as pd
+
+import monthly_stats
+import prepare_data
+from utils.rollup_utils import build_rollup, monthly_summary
+
+NOW = datetime(2025, 1, 15, 12, 0)
+
+# The per-row process_data_for_months the rollup summary replaced
+def rowwise_process_data_for_months(df, year, months):
+    monthly_data = {}
+
+    for month in months:
+        month_data = df[
+            ((df["receivedDate"].dt.month == month) & (df["receivedDate"].dt.year == year)) |
+            ((df["rejectedDate"].dt.month == month) & (df["rejectedDate"].dt.year == year))
+        ]
+
+        completed_samples = month_data[(month_data["sampleResulted"] == True) | (month_data["sampleRejected"] == True)]
+        total_completed_samples = completed_samples.shape[0]
+        total_kits_resulted = completed_samples["sampleResulted"].sum()
+        total_kits_rejected = completed_samples["sampleRejected"].sum()
+        uncounted_kits = total_completed_samples - (total_kits_resulted + total_kits_rejected)
+
+        warning = ""
+        if uncounted_kits > 0:
+            warning = f"WARNING: there are {uncounted_kits} samples in this data that are not resulted or rejected"
+        elif uncounted_kits < 0:
+            warning = f"WARNING: there are {uncounted_kits * -1} samples in this data that are both resulted and rejected"
+
+        shipped_samples = completed_samples[completed_samples["shippingTime"].notna()]
+        processed_samples = completed_samples[completed_samples["labProcessingTime"].notna()]
+        published_samples = completed_samples[completed_samples["reportPublishingTime"].notna()]
+        breaks_guarantee = completed_samples[completed_samples["breaksGuarantee"] == True]
+        shipping = shipped_samples["shippingTime"]
+        processing = processed_samples["labProcessingTime"]
+        publishing = published_samples["reportPublishingTime"]
+        total = breaks_guarantee["totalProcessingTime"]
+
+        monthly_data[month] = {
+            "Month": int(month),
+            "total_completed_samples": total_completed_samples,
+            "total_kits_resulted": total_kits_resulted,
+            "total_kits_rejected": total_kits_rejected,
+            "kits_shipped_usps": shipping.notna().sum(),
+            "avg_shipping_time": shipping.mean().round(2),
+            "shipped_under_3": (shipping <= 3).sum(),
+            "shipped_under_5": ((shipping <= 5) & (shipping > 3)).sum(),
+            "shipped_over_5": (shipping > 5).sum(),
+            "samples_processed_ussl": processing.notna().sum(),
+            "avg_lab_processing_time": processing.mean().round(2),
+            "processed_under_2": (processing <= 2).sum(),
+            "processed_under_4": ((processing <= 4) & (processing > 2)).sum(),
+            "processed_over_4": (processing > 4).sum(),
+            "reports_published_siphox": publishing.notna().sum(),
+            "avg_report_publishing_time": publishing.mean().round(2),
+            "published_under_2": (publishing <= 2).sum(),
+            "published_over_2": (publishing > 2).sum(),
+            "avg_total_processing_time": month_data["totalProcessingTime"].mean().round(2),
+            "num_breaks_guarantee": total.notna().sum(),
+            "breaks_guarantee_under_7": ((total < 7) & (total >= 5)).sum(),
+            "breaks_guarantee_under_12": ((total < 12) & (total >= 7)).sum(),
+            "breaks_guarantee_max": (total >= 12).sum(),
+            "warning": warning,
+        }
+
+    return pd.DataFrame(monthly_data).transpose()
+
+def _assert_same_summary(got, expected):
+    expected = expected.reset_index(drop=True).infer_objects()
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False, check_exact=False, rtol=1e-6)
+
+def test_rollup_summary_matches_the_rowwise_one(client):
+    base = prepare_data.prepare_base(client=client, ttl=0, exclude_skus=True)
+    df = monthly_stats.filter_extraneous_values(prepare_data.as_of(base, NOW))
+    months = list(range(1, 13))
+    expected = rowwise_process_data_for_months(df, 2024, months)
+    assert expected["total_completed_samples"].sum() > 0
+
+    # as main builds it: from the rollup, filtered again
+    rollup = monthly_stats.filter_extraneous_values(build_rollup(df))
+    _assert_same_summary(monthly_summary(rollup, [(2024, month) for month in months]), expected)
+    _assert_same_summary(monthly_stats.process_data_for_months(df, 2024, months), expected)
+
+def test_backfill_summary_has_the_columns_of_main(tmp_path, monkeypatch, client):
+    base = prepare_data.prepare_base(client=client, ttl=0, exclude_skus=True)
+    df = prepare_data.as_of(base, NOW)
+    monkeypatch.setattr(monthly_stats, "prepare_data", lambda **kwargs: df)
+    periods = monthly_stats.month_range((2023, 11), (2024, 2))
+
+    summary = monthly_stats.backfill((2023, 11), (2024, 2), directory=str(tmp_path), workers=1)
+    rollup = monthly_stats.filter_extraneous_values(build_rollup(monthly_stats.filter_extraneous_values(df)))
+    expected = monthly_summary(rollup, periods)
+    pd.testing.assert_frame_equal(summary, expected)
+    written = pd.read_csv(tmp_path / "monthly_processing_time_summary.csv")
+    assert list(written.columns) == list(expected.columns)
+    assert list(pd.read_csv(tmp_path / "2024-01" / "monthly_processing_time_summary.csv").columns) == list(expected.columns[1:])
@@ -0,0 +1,42 @@
+import math
+import os
+
+import pandas as pd
+
+from utils import plot_utils
+from utils.plot_utils import figure_spec, render_figures
+
+
+def _stats(shift=0.0):
+    return pd.DataFrame({
+        "measure": ["shippingTime", "labProcessingTime", "reportPublishingTime"],
+        "whislo": [0.5, 0.2, 0.1], "q1": [1.5, 1.0, 0.4], "med": [2.0, 1.5, 0.8],
+        "q3": [3.0, 2.5, 1.2], "whishi": [5.0 + shift, 4.0, 2.0],
+    }).set_index("measure")
+
+def _specs(directory, shift=0.0):
+    return [
+        figure_spec(os.path.join(directory, "processing_times_2024-11.png"), "Month 11 2024 Processing Times", _stats()),
+        figure_spec(os.path.join(directory, "processing_times_2024-12.png"), "Month 12 2024 Processing Times", _stats(shift)),
+    ]
+
+def test_render_figures_skips_unchanged_figures(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    november, december = (spec["path"] for spec in _specs(directory))
+    paths, drawn = render_figures(_specs(directory), workers=1)
+    assert paths == drawn == [november, december]
+    assert os.path.exists(os.path.join(directory, plot_utils.MANIFEST_NAME))
+
+    assert render_figures(_specs(directory), workers=1) == ([november, december], [])
+    # a changed spec, a deleted figure and a new layout version are redrawn
+    assert render_figures(_specs(directory, shift=1.0), workers=1)[1] == [december]
+    os.remove(november)
+    assert render_figures(_specs(directory, shift=1.0), workers=1)[1] == [november]
+    monkeypatch.setattr(plot_utils, "PLOT_VERSION", plot_utils.PLOT_VERSION + 1)
+    assert render_figures(_specs(directory, shift=1.0), workers=1)[1] == [november, december]
+
+def test_missing_measure_draws_an_empty_panel(tmp_path):
+    spec = figure_spec(str(tmp_path / "empty.png"), "Empty", _stats().drop("labProcessingTime"))
+    assert all(math.isnan(value) for value in spec["panels"][1]["box"].values())
+    assert render_figures([spec], workers=1)[1] == [spec["path"]]
+    assert os.path.getsize(spec["path"]) > 0
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+import prepare_data
+from utils.mongo_utils import pull_mongo_frame
+
+
+def _client_side(df, exclude_skus):
+    data = prepare_data.filter_vals(df)
+    return prepare_data.filter_skus(data) if exclude_skus else data
+
+@pytest.mark.parametrize("exclude_skus", [False, True])
+def test_query_selects_the_client_side_rows(client, exclude_skus):
+    everything = pull_mongo_frame(client)
+    pushed = pull_mongo_frame(client, prepare_data.build_query(exclude_skus))
+    expected = _client_side(everything, exclude_skus)
+    assert 0 < len(pushed) < len(everything)
+    assert sorted(pushed["sampleID"]) == sorted(expected["sampleID"])
+
+@pytest.mark.parametrize("exclude_skus", [False, True])
+def test_query_prepares_the_same_frame(client, exclude_skus):
+    # the full pull also holds missing flags, so raw dtypes differ until the schema is applied
+    everything = prepare_data._prepare_serial(pull_mongo_frame(client), exclude_skus)
+    pushed = prepare_data._prepare_serial(pull_mongo_frame(client, prepare_data.build_query(exclude_skus)), exclude_skus)
+    everything, pushed = prepare_data.apply_schema(everything), prepare_data.apply_schema(pushed)
+    pd.testing.assert_frame_equal(
+        everything.sort_values("sampleID").reset_index(drop=True),
+        pushed.sort_values("sampleID").reset_index(drop=True),
+    )
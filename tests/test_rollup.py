@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import prepare_data
+from utils.rollup_utils import DIMENSION_COLUMNS, KEY_COLUMNS, build_rollup
+
+
+def test_rollup_is_kept_apart_by_sku_selection(tmp_path, client):
+    path = str(tmp_path / "rollup.parquet")
+    prepare_data.prepare_base(client=client, ttl=0, exclude_skus=True, rollup_path=path)
+    assert prepare_data.load_rollup(path) == (None, None)
+    assert prepare_data.load_rollup(path, exclude_skus=True)[0] is not None
+
+    prepare_data.prepare_base(client=client, ttl=0, rollup_path=path)
+    assert prepare_data.load_rollup(path)[0] is not None
+    assert prepare_data.load_rollup(path, exclude_skus=True) == (None, None)
+
+def test_rollup_is_never_moved_back_in_time(client):
+    base = prepare_data.prepare_base(client=client, ttl=0)
+    as_of = datetime(2025, 1, 15, 12, 0)
+    rollup, metadata = prepare_data.refresh_rollup(None, None, base, as_of)
+
+    earlier, earlier_metadata = prepare_data.refresh_rollup(rollup, metadata, base, as_of - timedelta(hours=3))
+    assert earlier is rollup
+    assert earlier_metadata["as_of"] == as_of
+
+# Equal up to float dust in the sums, with missing keys as None (as read back from Parquet)
+def _assert_same_rollup(got, expected):
+    got, expected = (
+        rollup.astype({column: object for column in DIMENSION_COLUMNS})
+        .where(rollup.notna(), None)
+        .sort_values(KEY_COLUMNS).reset_index(drop=True)
+        for rollup in (got, expected)
+    )
+    pd.testing.assert_frame_equal(got, expected, check_exact=False, rtol=1e-9)
+
+def test_refreshed_rollup_matches_a_rebuild(client):
+    base = prepare_data.prepare_base(client=client, ttl=0)
+    first, later = datetime(2025, 1, 6, 9, 0), datetime(2025, 1, 14, 9, 0)
+    rollup, metadata = prepare_data.refresh_rollup(None, None, base, first)
+
+    # some samples unsettled at `first` only break the guarantee by `later`, which settles them
+    unsettled = set(metadata["unsettled"])
+    overdue_later = prepare_data.as_of(base, later)
+    overdue_later = set(overdue_later.loc[overdue_later["breaksGuarantee"], "sampleID"])
+    assert unsettled & overdue_later
+
+    rollup, metadata = prepare_data.refresh_rollup(rollup, metadata, base, later)
+    assert not unsettled & overdue_later & set(metadata["unsettled"])
+    _assert_same_rollup(rollup, build_rollup(prepare_data.as_of(base, later)))
+
+def test_incremental_rollup_matches_a_rebuild(tmp_path, client):
+    snapshot_path, rollup_path = str(tmp_path / "snapshot.parquet"), str(tmp_path / "rollup.parquet")
+    first, later = datetime(2025, 1, 6, 9, 0), datetime(2025, 1, 14, 9, 0)
+    prepare_data.prepare_base(True, snapshot_path, client, ttl=0, rollup_path=rollup_path, as_of_ts=first)
+
+    # results come in for some of the unsettled samples, which settles them
+    _, metadata = prepare_data.load_rollup(rollup_path)
+    collection = client["quantify"]["spot-history-statuses"]
+    newest = collection.find_one(sort=[("lastUpdatedDate", -1)])["lastUpdatedDate"]
+    resulted = metadata["unsettled"][:20]
+    assert resulted
+    collection.update_many(
+        {"sampleID": {"$in": resulted}},
+        {"$set": {"sampleResulted": True, "sampleResultedDiff": 30.0, "lastUpdatedDate": newest + timedelta(hours=1)}},
+    )
+
+    base = prepare_data.prepare_base(True, snapshot_path, client, ttl=0, rollup_path=rollup_path, as_of_ts=later)
+    rollup, metadata = prepare_data.load_rollup(rollup_path)
+    assert not set(resulted) & set(metadata["unsettled"])
+    _assert_same_rollup(rollup, build_rollup(prepare_data.as_of(base, later)))
@@ -0,0 +1,41 @@
+import pandas as pd
+
+import prepare_data
+from conftest import make_client
+from utils.snapshot_utils import read_snapshot_metadata, save_snapshot
+
+
+def _full(client):
+    return prepare_data.prepare_base(client=client, ttl=0)
+
+def _incremental(client, path):
+    return prepare_data.prepare_base(incremental=True, snapshot_path=str(path), client=client, ttl=0)
+
+def _same_rows(a, b):
+    a = a.sort_values("sampleID").reset_index(drop=True)
+    b = b.sort_values("sampleID").reset_index(drop=True)
+    pd.testing.assert_frame_equal(a, b)
+
+def test_unavailable_mongo_does_not_save_an_empty_snapshot(tmp_path, monkeypatch, client):
+    path = tmp_path / "snapshot.parquet"
+    monkeypatch.setattr(prepare_data, "connect_mongo", lambda: None)
+    assert _incremental(None, path).empty
+    assert read_snapshot_metadata(str(path)) is None
+
+    _same_rows(_incremental(client, path), _full(client))
+    assert read_snapshot_metadata(str(path))["watermark"] is not None
+
+def test_empty_pull_does_not_save_an_empty_snapshot(tmp_path):
+    path = tmp_path / "snapshot.parquet"
+    assert _incremental(make_client(0), path).empty
+    assert read_snapshot_metadata(str(path)) is None
+
+    client = make_client()
+    _same_rows(_incremental(client, path), _full(client))
+
+def test_snapshot_without_watermark_is_rebuilt(tmp_path, client):
+    path = tmp_path / "snapshot.parquet"
+    empty = _full(make_client(0))
+    save_snapshot(empty, str(path), None, prepare_data.query_hash(prepare_data.build_query(), prepare_data.PROJECTION, prepare_data.SNAPSHOT_VERSION))
+
+    _same_rows(_incremental(client, path), _full(client))
@@ -0,0 +1,61 @@
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+
+# the filters never touch streamlit itself, which the tests do not need installed
+sys.modules.setdefault("streamlit", types.ModuleType("streamlit"))
+from utils.streamlit_utils import (
+    BOOL_FILTER_COLUMNS, FILTER_KEY_COLUMNS, RANGE_COLUMNS, add_filter_keys, filter_dataframe, widget_metadata,
+)
+
+
+def _frame():
+    return pd.DataFrame({
+        "orderID": ["o-100", "o-101", "o-200", None, "o-300"],
+        "sampleID": ["s-1", "s-2", "s-3", "s-4", None],
+        "businessKey": ["b2c", "b2b", "b2c", "b2c", "b2b"],
+        "country": ["US", "US", "CA", "US", "CA"],
+        "spotSku": ["a", "b", "a", "a", "c"],
+        "spotSkuType": ["BLOOD", "BLOOD", "SALIVA", "BLOOD", "BLOOD"],
+        **{column: pd.array([True, False, None, True, True], dtype="boolean") for column in BOOL_FILTER_COLUMNS},
+        **{column: np.array([1.0, 4.0, np.nan, 6.0, 2.5], dtype="float32") for column in RANGE_COLUMNS},
+        "deliveredDate": pd.to_datetime(["2024-01-05", "2024-02-10", None, "2023-02-01", "2024-03-01"]),
+        "receivedDate": pd.to_datetime(["2024-01-08", None, "2024-02-02", "2024-03-03", "2024-03-04"]),
+    })
+
+def _filters(**selected):
+    filters = {column: [] for column in ["businessKey", "country", "spotSku", "spotSkuType"]}
+    filters.update({column: "ALL" for column in BOOL_FILTER_COLUMNS})
+    filters.update({column: (None, None) for column in RANGE_COLUMNS})
+    filters.update(selectedYears=[], selectedMonths=[], orderID="", sampleID="")
+    filters.update(selected)
+    return filters
+
+def _sample_ids(df, **selected):
+    filtered = filter_dataframe(df, _filters(**selected))
+    assert not set(FILTER_KEY_COLUMNS) & set(filtered.columns)
+    return filtered["sampleID"].tolist()
+
+def test_filter_dataframe():
+    for df in (_frame(), add_filter_keys(_frame())):
+        assert _sample_ids(df) == ["s-1", "s-2", "s-3", "s-4", None]
+        assert _sample_ids(df, businessKey=["b2c"], country=["US"]) == ["s-1", "s-4"]
+        # missing flags match neither True nor False
+        assert _sample_ids(df, sampleResulted="True") == ["s-1", "s-4", None]
+        assert _sample_ids(df, sampleResulted="False") == ["s-2"]
+        # range filters are inclusive and drop missing values
+        assert _sample_ids(df, shippingTime=(2.5, 4.0)) == ["s-2", None]
+        # either date in a selected year and month
+        assert _sample_ids(df, selectedYears=[2024]) == ["s-1", "s-2", "s-3", "s-4", None]
+        assert _sample_ids(df, selectedYears=[2024], selectedMonths=[2]) == ["s-2", "s-3"]
+        assert _sample_ids(df, selectedMonths=[2]) == ["s-2", "s-3", "s-4"]
+        assert _sample_ids(df, orderID="o-1") == ["s-1", "s-2"]
+        assert _sample_ids(df, orderID="o-", spotSku=["a"], sampleID="3") == ["s-3"]
+
+def test_widget_metadata():
+    metadata = widget_metadata(_frame())
+    assert metadata["options"]["country"] == ["US", "CA"]
+    assert metadata["options"]["spotSku"] == ["a", "b", "c"]
+    assert metadata["ranges"]["totalProcessingTime"] == (1.0, 6.0)
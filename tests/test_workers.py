@@ -0,0 +1,12 @@
+import pandas as pd
+
+import prepare_data
+from benchmarks.generate_data import generate_frame
+
+
+def test_process_pool_matches_serial_mode():
+    raw = generate_frame(3000, seed=1, span_days=200)
+    for exclude_skus in (False, True):
+        serial = prepare_data._prepare_frame(raw.copy(), exclude_skus)
+        parallel = prepare_data._prepare_frame(raw.copy(), exclude_skus, workers=2)
+        pd.testing.assert_frame_equal(serial, parallel)
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pandas as pd
+
+from utils.date_utils import calc_diff_days2_vectorized
+
+# Business days since drop-off at which an overdue sample moves to the next aging band
+OVERDUE_BAND_DAYS = [float(days) for days in os.getenv("OVERDUE_BAND_DAYS", "7,12").split(",")]
+
+
+def band_labels(edges=OVERDUE_BAND_DAYS):
+    """Names of the aging bands of `edges`: <7, <12, >=12 for the default 7,12."""
+    return [f"<{edge:g}" for edge in edges] + [f">={edges[-1]:g}"]
+
+def _flag(values):
+    return pd.Series(values).eq(True).fillna(False).to_numpy(bool)
+
+def days_overdue(in_lab, today):
+    """Business days since each sample was dropped off, as of `today` (NaN without a drop-off)."""
+    return calc_diff_days2_vectorized(in_lab["droppedOffDate"], today)
+
+def aging_band(in_lab, today, edges=OVERDUE_BAND_DAYS):
+    """Aging band of each sample (an index into band_labels(edges)), -1 when it is not overdue."""
+    band = np.digitize(days_overdue(in_lab, today), edges)
+    return np.where(_flag(in_lab["breaksGuarantee"]), band, -1)
+
+def in_lab_counts(in_lab, today, edges=OVERDUE_BAND_DAYS):
+    """Every count of the daily message from one pass over the in-lab samples: the status
+    flags are read once and each count is the sum of a combination of them. The totals
+    count rows with a sampleID, the aging bands every overdue row."""
+    has_id = in_lab["sampleID"].notna().to_numpy()
+    delivered = has_id & _flag(in_lab["sampleDelivered"])
+    received = has_id & _flag(in_lab["sampleReceived"])
+    not_delivered = has_id & _flag(in_lab["sampleDelivered"].eq(False))
+    not_received = has_id & _flag(in_lab["sampleReceived"].eq(False))
+    days_received = np.where(has_id, in_lab["daysSinceReceived"].to_numpy("float64", na_value=np.nan), np.nan)
+    band = aging_band(in_lab, today, edges)
+
+    counts = {
+        "total": int(has_id.sum()),
+        "delivered_not_received": int((delivered & not_received).sum()),
+        "received_not_delivered": int((not_delivered & received).sum()),
+        "not_processed": int((delivered & received).sum()),
+        "less_than_two_days": int((days_received < 2.0).sum()),
+        "two_or_more_days": int((days_received >= 2.0).sum()),
+        "overdue": int((has_id & (band >= 0)).sum()),
+    }
+    per_band = np.bincount(band[band >= 0], minlength=len(edges) + 1)
+    counts["overdue_bands"] = dict(zip(band_labels(edges), per_band.tolist()))
+    return counts
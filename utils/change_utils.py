@@ -0,0 +1,112 @@
+import os
+import time
+from bson import json_util
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+
+from utils.mongo_utils import PROJECTION, MONGO_BATCH_SIZE
+
+load_dotenv()
+
+# Seconds between two polls of the collection when change streams are unavailable
+MONITOR_POLL_SECONDS = float(os.getenv("MONITOR_POLL_SECONDS", "60"))
+# Longest a change stream waits for changes before handing back an empty batch
+MONITOR_AWAIT_MS = int(os.getenv("MONITOR_AWAIT_MS", "5000"))
+
+# Change events carrying a document the reports may need to recount
+_CHANGE_PIPELINE = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+
+
+def _collection(client):
+    return client['quantify']['spot-history-statuses']
+
+def changed_since(client, since):
+    """The documents of spot-history-statuses updated at or after `since` (None: all)."""
+    query = {"lastUpdatedDate": {"$gte": since}} if since is not None else {}
+    return list(_collection(client).find(query, PROJECTION))
+
+def latest_update(client):
+    """The newest lastUpdatedDate in spot-history-statuses, or None when it has none."""
+    document = _collection(client).find_one(
+        {"lastUpdatedDate": {"$ne": None}}, {"lastUpdatedDate": 1}, sort=[("lastUpdatedDate", -1)]
+    )
+    return document["lastUpdatedDate"] if document else None
+
+def open_change_stream(client, max_await_ms=MONITOR_AWAIT_MS):
+    """Open a change stream on spot-history-statuses with the full document of every change.
+
+    Raises PyMongoError when the deployment has no change streams, i.e. it is not a
+    replica set (and TypeError under mongomock, which has no watch).
+    """
+    return _collection(client).watch(_CHANGE_PIPELINE, full_document="updateLookup", max_await_time_ms=max_await_ms)
+
+def stream_changes(stream, batch_size=MONGO_BATCH_SIZE):
+    """Yield batches of changed documents from an open change stream, as they happen: a
+    batch is whatever arrived within the stream's max await time (up to `batch_size`
+    documents) and may be empty."""
+    with stream:
+        while stream.alive:
+            batch = []
+            while len(batch) < batch_size:
+                change = stream.try_next()
+                if change is None:
+                    break
+                if change.get("fullDocument"):
+                    batch.append(change["fullDocument"])
+            yield batch
+
+def poll_changes(client, since, interval=MONITOR_POLL_SECONDS):
+    """Yield the documents updated since the previous poll every `interval` seconds,
+    starting from `since` (None: from now on).
+
+    Each poll asks for updates at or after the newest one seen, so a document updated in
+    the same instant is not missed, and leaves out the documents already yielded at that
+    instant: a poll without changes yields an empty batch.
+    """
+    if since is None:
+        since = latest_update(client)
+    seen = set()
+    while True:
+        batch = [
+            document for document in changed_since(client, since)
+            if (document.get("sampleID"), document.get("lastUpdatedDate")) not in seen
+        ]
+        updates = [document["lastUpdatedDate"] for document in batch if document.get("lastUpdatedDate")]
+        if updates and max(updates) != since:
+            since, seen = max(updates), set()
+        seen.update((document.get("sampleID"), since) for document in batch if document.get("lastUpdatedDate") == since)
+        yield batch
+        time.sleep(interval)
+
+def replay_changes(path, batch_size=100, interval=0.0):
+    """Yield the documents of a replay file (one Extended JSON document per line, e.g. from
+    mongoexport) in batches of `batch_size`, `interval` seconds apart, for local testing."""
+    batch = []
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                batch.append(json_util.loads(line))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+                time.sleep(interval)
+    if batch:
+        yield batch
+
+def change_source(client, since, poll_interval=MONITOR_POLL_SECONDS):
+    """Batches of the documents changed since `since` (None: from now on): the catch-up from
+    `since` first, then a change stream when the deployment has one, else polling every
+    `poll_interval` seconds."""
+    if since is None:
+        since = latest_update(client)
+    try:
+        # opened before the catch-up so no change slips in between; documents are looked up
+        # when their event is read, so they are never older than the catch-up
+        stream = open_change_stream(client)
+    except (PyMongoError, TypeError) as e:
+        print(f"Change streams unavailable ({e}), polling every {poll_interval:g}s")
+        yield from poll_changes(client, since, poll_interval)
+        return
+    print("Following spot-history-statuses through a change stream")
+    yield changed_since(client, since)
+    yield from stream_changes(stream)
@@ -1,32 +1,138 @@
-from datetime import datetime, timedelta
+import os
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 import numpy as np
+import pandas as pd
 
-major_american_holidays = [
-    "2024-01-01",  # New Year's Day
-    "2024-01-15",  # Martin Luther King Jr. Day
-    "2024-02-19",  # Presidents' Day
-    "2024-05-27",  # Memorial Day
-    "2024-07-04",  # Independence Day
-    "2024-09-02",  # Labor Day
-    "2024-10-14",  # Columbus Day
-    "2024-11-11",  # Veterans Day
-    "2024-11-28",  # Thanksgiving Day
-    "2024-12-25",  # Christmas Day
-]
+# timezone the reports are expressed in
+EASTERN_TIMEZONE = "America/New_York"
+
+# default year range covered by the business calendar (data outside it widens the range)
+BUSINESS_CALENDAR_START_YEAR = int(os.getenv("BUSINESS_CALENDAR_START_YEAR", 2020))
+BUSINESS_CALENDAR_END_YEAR = int(os.getenv("BUSINESS_CALENDAR_END_YEAR", datetime.now().year + 1))
+
+# nth weekday (0=Monday) of a month, n=-1 for the last one
+def _nth_weekday(year, month, weekday, n):
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+# fixed-date holidays falling on a weekend are observed on the Friday before / Monday after
+def _observed(day):
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+# major American holidays of a year, as observed
+def us_holidays(year):
+    return [
+        _observed(date(year, 1, 1)),        # New Year's Day
+        _nth_weekday(year, 1, 0, 3),        # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),        # Presidents' Day
+        _nth_weekday(year, 5, 0, -1),       # Memorial Day
+        _observed(date(year, 7, 4)),        # Independence Day
+        _nth_weekday(year, 9, 0, 1),        # Labor Day
+        _nth_weekday(year, 10, 0, 2),       # Columbus Day
+        _observed(date(year, 11, 11)),      # Veterans Day
+        _nth_weekday(year, 11, 3, 4),       # Thanksgiving Day
+        _observed(date(year, 12, 25)),      # Christmas Day
+    ]
+
+class BusinessCalendar:
+    """US business days (weekdays minus major holidays) for a range of years.
+
+    Besides the np.busdaycalendar, keeps a prefix-sum table of business-day
+    ordinals so a business-day count is two lookups and a subtraction. Dates
+    outside the range fall back to numpy with the same holidays.
+    """
+
+    def __init__(self, start_year, end_year):
+        self.start_year = start_year
+        self.end_year = end_year
+        self.holidays = np.array(
+            [day for year in range(start_year, end_year + 1) for day in us_holidays(year)],
+            dtype="datetime64[D]",
+        )
+        self.busdaycal = np.busdaycalendar(holidays=self.holidays)
+        self.first_day = np.datetime64(f"{start_year}-01-01", "D")
+        self.last_day = np.datetime64(f"{end_year + 1}-01-01", "D")
+        days = np.arange(self.first_day, self.last_day + 1)
+        # ordinals[i] = business days in [first_day, first_day + i)
+        self.ordinals = np.zeros(len(days), dtype="int64")
+        np.cumsum(np.is_busday(days[:-1], busdaycal=self.busdaycal), out=self.ordinals[1:])
+
+    def _offsets(self, days):
+        offsets = (days - self.first_day).astype("int64")
+        in_range = (offsets >= 0) & (offsets < len(self.ordinals) - 1)
+        return offsets, in_range
+
+    # same result as np.busday_count(start_days, end_days, busdaycal=self.busdaycal)
+    def busday_count(self, start_days, end_days):
+        start_days = np.asarray(start_days, dtype="datetime64[D]")
+        end_days = np.asarray(end_days, dtype="datetime64[D]")
+        start_offsets, start_in_range = self._offsets(start_days)
+        end_offsets, end_in_range = self._offsets(end_days)
+        in_range = start_in_range & end_in_range
+        # numpy counts [start, end) forwards but (end, start] backwards
+        backwards = start_days > end_days
+        start_offsets = start_offsets + backwards
+        end_offsets = end_offsets + backwards
+        if in_range.all():
+            return self.ordinals[end_offsets] - self.ordinals[start_offsets]
+        counts = np.busday_count(start_days, end_days, busdaycal=self.busdaycal)
+        counts[in_range] = self.ordinals[end_offsets[in_range]] - self.ordinals[start_offsets[in_range]]
+        return counts
+
+    # same result as np.is_busday(days, busdaycal=self.busdaycal)
+    def is_busday(self, days):
+        days = np.asarray(days, dtype="datetime64[D]")
+        offsets, in_range = self._offsets(days)
+        if in_range.all():
+            return self.ordinals[offsets + 1] > self.ordinals[offsets]
+        flags = np.is_busday(days, busdaycal=self.busdaycal)
+        flags[in_range] = self.ordinals[offsets[in_range] + 1] > self.ordinals[offsets[in_range]]
+        return flags
+
+# one calendar per year range, shared by every caller in the process
+@lru_cache(maxsize=None)
+def get_business_calendar(start_year=BUSINESS_CALENDAR_START_YEAR, end_year=BUSINESS_CALENDAR_END_YEAR):
+    return BusinessCalendar(start_year, end_year)
+
+# the shared calendar, widened if the given dates (columns, arrays or scalars) fall outside the default years
+def calendar_for_dates(*dates):
+    start_year, end_year = BUSINESS_CALENDAR_START_YEAR, BUSINESS_CALENDAR_END_YEAR
+    for values in dates:
+        values = _to_datetime64(np.atleast_1d(values))
+        values = values[~np.isnat(values)]
+        if len(values):
+            start_year = min(start_year, values.min().astype(object).year)
+            end_year = max(end_year, values.max().astype(object).year)
+    return get_business_calendar(start_year, end_year)
 
 # convert dates to est
 def convert_to_est(date, is_dst):
     hours_to_subtract = 4 if is_dst else 5
     return date - timedelta(hours=hours_to_subtract)
 
+# convert a column of UTC datetimes to naive US Eastern wall-clock time, following DST
+def convert_to_est_vectorized(dates):
+    dates = pd.to_datetime(dates)
+    if dates.dt.tz is None:
+        dates = dates.dt.tz_localize("UTC")
+    return dates.dt.tz_convert(EASTERN_TIMEZONE).dt.tz_localize(None)
+
 # function that returns the updated date
 def date_updated(start_date, days_to_add):
     time_change = timedelta(days=days_to_add)
     new_date = start_date + time_change
-    return new_date  
+    return new_date
 
 # function that takes the updated date and calculates days since then
-def calc_diff_days(start_date, days_to_add, holidays=major_american_holidays):
+def calc_diff_days(start_date, days_to_add, calendar=None):
     # Ensure start_date is a datetime object
     if isinstance(start_date, str):
         start_date = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S.%f")
@@ -34,19 +140,20 @@ def calc_diff_days(start_date, days_to_add, holidays=major_american_holidays):
     new_date = date_updated(start_date, days_to_add)  # Calculate new date
     today = datetime.now()  # Use current date and time
 
-    # Ensure holidays are in datetime.date format
-    holidays = [datetime.strptime(day, "%Y-%m-%d").date() if isinstance(day, str) else day for day in holidays]
+    if calendar is None:
+        calendar = get_business_calendar()
+    busdaycal = calendar.busdaycal
     
     # Calculate the number of full business days
-    full_business_days = np.busday_count(new_date.date(), today.date(), holidays=holidays)
+    full_business_days = np.busday_count(new_date.date(), today.date(), busdaycal=busdaycal)
     
     # Calculate fractional part of the day for new_date and today
-    if today.date() > new_date.date() and np.is_busday(new_date.date(), holidays=holidays):
+    if today.date() > new_date.date() and np.is_busday(new_date.date(), busdaycal=busdaycal):
         start_fraction = (new_date + timedelta(days=1) - new_date).total_seconds() / (24 * 3600)
     else:
         start_fraction = 0
     
-    if np.is_busday(today.date(), holidays=holidays):
+    if np.is_busday(today.date(), busdaycal=busdaycal):
         end_fraction = today.hour / 24 + today.minute / 1440 + today.second / 86400 + today.microsecond / 86400000000
     else:
         end_fraction = 0
@@ -56,7 +163,7 @@ def calc_diff_days(start_date, days_to_add, holidays=major_american_holidays):
     return round(total_days_fractional, 3)
 
 # function that takes the updated date and calculates days since then
-def calc_diff_days2(start_date, end_date, holidays=major_american_holidays):
+def calc_diff_days2(start_date, end_date, calendar=None):
     # Ensure start_date is a datetime object
     if isinstance(start_date, str):
         start_date = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S.%f")
@@ -65,23 +172,107 @@ def calc_diff_days2(start_date, end_date, holidays=major_american_holidays):
     if isinstance(end_date, str):
         end_date = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S.%f")
     
-    # Ensure holidays are in datetime.date format
-    holidays = [datetime.strptime(day, "%Y-%m-%d").date() if isinstance(day, str) else day for day in holidays]
+    if calendar is None:
+        calendar = get_business_calendar()
+    busdaycal = calendar.busdaycal
     
     # Calculate the number of full business days
-    full_business_days = np.busday_count(start_date.date(), end_date.date(), holidays=holidays)
+    full_business_days = np.busday_count(start_date.date(), end_date.date(), busdaycal=busdaycal)
     
     # Calculate fractional part of the day for new_date and today
-    if end_date.date() > start_date.date() and np.is_busday(start_date.date(), holidays=holidays):
+    if end_date.date() > start_date.date() and np.is_busday(start_date.date(), busdaycal=busdaycal):
         start_fraction = (start_date + timedelta(days=1) - start_date).total_seconds() / (24 * 3600)
     else:
         start_fraction = 0
     
-    if np.is_busday(end_date.date(), holidays=holidays):
+    if np.is_busday(end_date.date(), busdaycal=busdaycal):
         end_fraction = end_date.hour / 24 + end_date.minute / 1440 + end_date.second / 86400 + end_date.microsecond / 86400000000
     else:
         end_fraction = 0
 
     total_days_fractional = full_business_days + end_fraction - start_fraction
     
-    return round(total_days_fractional, 3)
\ No newline at end of file
+    return round(total_days_fractional, 3)
+
+# convert a column/array of datetimes (NaT/None allowed) to datetime64[us]
+def _to_datetime64(dates):
+    if not isinstance(dates, pd.Series):
+        dates = pd.Series(dates)
+    if not pd.api.types.is_datetime64_dtype(dates):
+        dates = pd.to_datetime(dates)
+    return dates.to_numpy().astype("datetime64[us]")
+
+# business-day difference between two datetime64[us] arrays, same rules as calc_diff_days2
+def _busday_diff(start_dates, end_dates, calendar=None):
+    result = np.full(start_dates.shape, np.nan)
+    valid = ~(np.isnat(start_dates) | np.isnat(end_dates))
+    start_dates = start_dates[valid]
+    end_dates = end_dates[valid]
+    if calendar is None:
+        calendar = calendar_for_dates(start_dates, end_dates)
+
+    start_days = start_dates.astype("datetime64[D]")
+    end_days = end_dates.astype("datetime64[D]")
+
+    # Calculate the number of full business days
+    full_business_days = calendar.busday_count(start_days, end_days)
+
+    # A started business day always counts as one full day, as in the scalar version
+    start_fraction = np.where(
+        (end_days > start_days) & calendar.is_busday(start_days), 1.0, 0.0
+    )
+
+    # Same summation order as the scalar version so results are bit-identical
+    microseconds = (end_dates - end_days).astype("int64")
+    hour, microseconds = np.divmod(microseconds, 3600000000)
+    minute, microseconds = np.divmod(microseconds, 60000000)
+    second, microsecond = np.divmod(microseconds, 1000000)
+    end_fraction = hour / 24 + minute / 1440 + second / 86400 + microsecond / 86400000000
+    end_fraction = np.where(calendar.is_busday(end_days), end_fraction, 0.0)
+
+    total_days_fractional = full_business_days + end_fraction - start_fraction
+
+    result[valid] = np.round(total_days_fractional, 3)
+    return result
+
+# vectorized date_updated, rounding days_to_add to microseconds the way timedelta() does
+def date_updated_vectorized(start_dates, days_to_add):
+    start_dates = _to_datetime64(start_dates)
+    days_to_add = np.asarray(days_to_add, dtype="float64")
+
+    fraction, whole_days = np.modf(days_to_add)
+    fraction_us, whole_us = np.modf(fraction * 86400000000.0)
+    offset = whole_days * 86400000000.0 + whole_us + np.rint(fraction_us)
+
+    valid = ~np.isnan(offset)
+    offset_us = np.zeros(offset.shape, dtype="int64")
+    offset_us[valid] = offset[valid].astype("int64")
+    new_dates = start_dates + offset_us.astype("timedelta64[us]")
+    new_dates[~valid] = np.datetime64("NaT")
+    return new_dates
+
+# vectorized calc_diff_days: business days from start_dates + days_to_add until now
+def calc_diff_days_vectorized(start_dates, days_to_add, calendar=None, now=None):
+    new_dates = date_updated_vectorized(start_dates, days_to_add)
+    today = np.datetime64(now if now is not None else datetime.now(), "us")
+    end_dates = np.full(new_dates.shape, today)
+    return _busday_diff(new_dates, end_dates, calendar)
+
+# vectorized calc_diff_days2: business days between two datetime columns, NaN where either is missing
+def calc_diff_days2_vectorized(start_dates, end_dates, calendar=None):
+    start_dates = _to_datetime64(start_dates)
+    if np.ndim(end_dates) == 0:
+        end_dates = np.full(start_dates.shape, np.datetime64(end_dates, "us"))
+    else:
+        end_dates = _to_datetime64(end_dates)
+    return _busday_diff(start_dates, end_dates, calendar)
+
+# (year, month) pairs from `start` to `end`, both (year, month) and inclusive
+def month_range(start, end):
+    first, last = start[0] * 12 + start[1] - 1, end[0] * 12 + end[1] - 1
+    return [(period // 12, period % 12 + 1) for period in range(first, last + 1)]
+
+# (year, month) of the last complete month before `today`
+def previous_month(today):
+    last_day = today.replace(day=1) - timedelta(days=1)
+    return last_day.year, last_day.month
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from utils.aging_utils import aging_band, band_labels
+from utils.snapshot_utils import load_snapshot, save_snapshot
+
+load_dotenv()
+
+# Keyed snapshot of the samples in the last daily report, compared against by the next one
+DAILY_SNAPSHOT_PATH = os.getenv("DAILY_SNAPSHOT_PATH", os.path.join("files", "daily_in_lab.parquet"))
+
+SNAPSHOT_FLAGS = ["sampleDelivered", "sampleReceived", "breaksGuarantee"]
+# Changes between two reports, in the order the message lists them
+CHANGES = ["arrived", "resulted", "rejected", "newly_overdue", "still_overdue"]
+
+
+def in_lab_snapshot(in_lab, today):
+    """The compact keyed form of an in-lab set: sampleID, status flags and aging band
+    (None when not overdue)."""
+    labels = np.array(band_labels() + [None], dtype=object)
+    snapshot = pd.DataFrame({
+        "sampleID": in_lab["sampleID"].astype("string"),
+        **{flag: in_lab[flag].astype("boolean") for flag in SNAPSHOT_FLAGS},
+        # -1 (not overdue) picks the trailing None
+        "agingBand": pd.Categorical(labels[aging_band(in_lab, today)], categories=band_labels()),
+    })
+    return snapshot[snapshot["sampleID"].notna()].drop_duplicates("sampleID", keep="last").reset_index(drop=True)
+
+def load_in_lab_snapshot(path=DAILY_SNAPSHOT_PATH):
+    """The snapshot of the last daily report and the time it was taken, or (None, None)."""
+    snapshot, metadata = load_snapshot(path)
+    if snapshot is None:
+        return None, None
+    return snapshot, metadata["watermark"]
+
+def save_in_lab_snapshot(snapshot, as_of, path=DAILY_SNAPSHOT_PATH):
+    """Persist the snapshot of a daily report taken as of `as_of`."""
+    save_snapshot(snapshot, path, as_of)
+
+def in_lab_deltas(previous, current, df):
+    """What changed between two in-lab snapshots, by a hash join on sampleID.
+
+    Returns one row per changed sample (sampleID, change, the current flags and aging band,
+    or the previous ones for samples that left, and the previous aging band) and the number
+    of samples per change. Samples that left the in-lab set count as resulted or rejected
+    when `df`, the prepared data of the current report, says so.
+    """
+    joined = previous.merge(current, on="sampleID", how="outer", suffixes=("_previous", ""), indicator=True)
+    # band labels as plain values, so snapshots taken with other OVERDUE_BAND_DAYS still compare
+    joined[["agingBand", "agingBand_previous"]] = joined[["agingBand", "agingBand_previous"]].astype(object)
+    left = joined["_merge"].eq("left_only").to_numpy()
+    both = joined["_merge"].eq("both").to_numpy()
+    # flags and band of the departed samples are their last known ones
+    for column in SNAPSHOT_FLAGS + ["agingBand"]:
+        joined[column] = joined[column].where(~left, joined[f"{column}_previous"])
+
+    status = df.loc[df["sampleID"].isin(joined.loc[left, "sampleID"]), ["sampleID", "sampleResulted", "sampleRejected"]]
+    status = status.drop_duplicates("sampleID", keep="last").set_index("sampleID").reindex(joined["sampleID"])
+    overdue = joined["breaksGuarantee"].eq(True).fillna(False).to_numpy(bool)
+    was_overdue = joined["breaksGuarantee_previous"].eq(True).fillna(False).to_numpy(bool)
+
+    change = np.select(
+        [
+            joined["_merge"].eq("right_only").to_numpy(),
+            left & status["sampleResulted"].eq(True).fillna(False).to_numpy(bool),
+            left & status["sampleRejected"].eq(True).fillna(False).to_numpy(bool),
+            both & overdue & ~was_overdue,
+            both & overdue & was_overdue,
+        ],
+        CHANGES,
+        default="",
+    )
+    joined["change"] = pd.Categorical(change, categories=CHANGES)
+    deltas = joined.loc[change != "", ["sampleID", "change"] + SNAPSHOT_FLAGS + ["agingBand", "agingBand_previous"]]
+    deltas = deltas.sort_values(["change", "sampleID"]).reset_index(drop=True)
+    counts = deltas["change"].value_counts().reindex(CHANGES, fill_value=0)
+    return deltas, {change: int(count) for change, count in counts.items()}
@@ -1,8 +1,17 @@
 import os
+import time
+import atexit
+import threading
+from importlib.util import find_spec
+from itertools import islice
 from dotenv import load_dotenv
+import bson
+import numpy as np
 import pandas as pd
 import pymongo
+from bson.raw_bson import RawBSONDocument
 from pymongo.errors import PyMongoError
+from utils.profiling_utils import stage, log_stage
 
 
 # Load environment variables from .env file
@@ -11,42 +20,168 @@ load_dotenv()
 # Retrieve MongoDB URI from environment variables
 MONGO_URI = os.getenv("MONGO_URI")
 
+# Client tuning, overridable in .env
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "10"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "10000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "300000"))
+
+# Wire compressors in order of preference, keeping only those whose library is installed
+# (zlib is built in); MONGO_COMPRESSORS="" turns compression off
+def _available_compressors():
+    installed = {"zstd": find_spec("zstandard") is not None,
+                 "snappy": find_spec("snappy") is not None,
+                 "zlib": True}
+    return ",".join(name for name, available in installed.items() if available)
+
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", _available_compressors())
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_mongo_client():
+    """Return the process-wide MongoClient, creating and pinging it on first use.
+
+    The client keeps a connection pool, so later calls reuse open (already
+    authenticated) connections instead of paying a new handshake. A forked child gets
+    its own client, since pymongo clients are not fork-safe. Returns None if MongoDB
+    cannot be reached.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            return _client
+        with stage("mongo.connect"):
+            options = {
+                "maxPoolSize": MONGO_MAX_POOL_SIZE,
+                "minPoolSize": MONGO_MIN_POOL_SIZE,
+                "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+                "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+            }
+            if MONGO_COMPRESSORS:
+                options["compressors"] = MONGO_COMPRESSORS
+            client = None
+            try:
+                client = pymongo.MongoClient(MONGO_URI, **options)
+                # Verify connection
+                client.admin.command('ping')
+                print("Connection successful!")
+            except PyMongoError as e:
+                print(f"Connection failed: {e}")
+                if client is not None:
+                    client.close()
+                return None
+        _client, _client_pid = client, os.getpid()
+        return _client
+
+def close_mongo_client():
+    """Close the process-wide client (registered to run at exit)."""
+    global _client
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+
+atexit.register(close_mongo_client)
+
 def connect_mongo():
-    """Connect to MongoDB and return the client."""
-    try:
-        client = pymongo.MongoClient(MONGO_URI)
-        # Verify connection
-        client.admin.command('ping')
-        print("Connection successful!")
-        return client
-    except PyMongoError as e:
-        print(f"Connection failed: {e}")
-        return None
-
-def pull_mongo_data(client):
-    """Pull data from MongoDB and return as a list of documents."""
+    """Connect to MongoDB and return the (shared) client."""
+    return get_mongo_client()
+
+# Fields of spot-history-statuses consumed by prepare_data. Derived fields stored in
+# Mongo (dates, times, breaksGuarantee, ...) are recomputed locally, so not fetched.
+PROJECTION = {
+    "_id": 0, "lastUpdatedDate": 1, "createdDate": 1, "sampleID": 1, "orderID": 1,
+    "businessKey": 1, "country": 1, "spotSku": 1, "spotSkuType": 1,
+    "sampleCollectionException": 1, "sampleDeliveryException": 1, "sampleCanceled": 1,
+    "kitCanceled": 1, "kitInTransit": 1, "kitInTransitDiff": 1, "kitDelivered": 1,
+    "kitDeliveredDiff": 1, "kitRegistered": 1, "kitRegisteredDiff": 1, "sampleInTransit": 1,
+    "sampleInTransitDiff": 1, "sampleDelivered": 1, "sampleDeliveredDiff": 1,
+    "sampleReceived": 1, "sampleReceivedDiff": 1, "sampleResulted": 1, "sampleResultedDiff": 1,
+    "sampleRejected": 1, "sampleRejectedDiff": 1, "orderPublished": 1, "orderPublishedDiff": 1,
+    "sampleCollectedDiff": 1
+}
+
+# Column types of the projected fields, used to build typed column buffers
+FIELD_TYPES = {
+    "lastUpdatedDate": "datetime", "createdDate": "datetime",
+    "sampleID": "string", "orderID": "string", "businessKey": "string", "country": "string",
+    "spotSku": "string", "spotSkuType": "string",
+    "sampleCollectionException": "bool", "sampleDeliveryException": "bool",
+    "sampleCanceled": "bool", "kitCanceled": "bool", "kitInTransit": "bool",
+    "kitDelivered": "bool", "kitRegistered": "bool", "sampleInTransit": "bool",
+    "sampleDelivered": "bool", "sampleReceived": "bool", "sampleResulted": "bool",
+    "sampleRejected": "bool", "orderPublished": "bool",
+    "kitInTransitDiff": "float", "kitDeliveredDiff": "float", "kitRegisteredDiff": "float",
+    "sampleInTransitDiff": "float", "sampleDeliveredDiff": "float",
+    "sampleReceivedDiff": "float", "sampleResultedDiff": "float",
+    "sampleRejectedDiff": "float", "orderPublishedDiff": "float", "sampleCollectedDiff": "float"
+}
+
+# Cast a column of the frame built from the documents to its FIELD_TYPES type; booleans
+# keep True/False/NaN objects when some are missing, so `== True` / `== False` filters
+# behave as before
+def _typed_column(field_type, column):
+    if field_type == "datetime":
+        return pd.to_datetime(column).astype("datetime64[ns]")
+    if field_type == "float":
+        return column.astype("float64")
+    if field_type == "bool":
+        missing = column.isna()
+        if not missing.any():
+            return column.astype(bool)
+        return column.astype(object).where(~missing, np.nan)
+    return column.astype(object)
+
+def documents_to_frame(documents, fields, batch_size=10000):
+    """Build a DataFrame from an iterable of documents (dicts or RawBSONDocuments).
+
+    The documents are turned into a frame by a single pd.DataFrame call, which copies the
+    fields out of the decoded dicts in C, then each column is cast once to its FIELD_TYPES
+    type. RawBSONDocuments are decoded `batch_size` at a time in bson.decode_all calls.
+    The time spent waiting on the cursor and building the frame are logged as the
+    mongo.fetch and mongo.build_frame stages.
+    """
+    field_types = {field: FIELD_TYPES.get(field, "object") for field in fields}
+    documents = iter(documents)
+    decoded = []
+    wall, cpu = time.perf_counter(), time.process_time()
+    while True:
+        batch = list(islice(documents, batch_size))
+        if not batch:
+            break
+        if isinstance(batch[0], RawBSONDocument):
+            batch = bson.decode_all(b"".join(document.raw for document in batch))
+        decoded.extend(batch)
+    log_stage({"stage": "mongo.fetch", "rows": len(decoded), "seconds": round(time.perf_counter() - wall, 4),
+               "cpu_seconds": round(time.process_time() - cpu, 4), "pid": os.getpid()})
+
+    with stage("mongo.build_frame", rows=len(decoded)):
+        frame = pd.DataFrame(decoded, columns=fields)
+        del decoded
+        return pd.DataFrame({
+            field: _typed_column(field_type, frame[field]) for field, field_type in field_types.items()
+        })
+
+def pull_mongo_frame(client, query=None, projection=PROJECTION, batch_size=MONGO_BATCH_SIZE):
+    """Pull data from MongoDB directly into a typed DataFrame.
+
+    The cursor fetches `batch_size` documents per round trip and decodes them in C, and
+    the frame is built from them in one pass (see documents_to_frame).
+    """
+    fields = [field for field, include in projection.items() if include]
     if client:
         table = client['quantify']
         collection = table['spot-history-statuses']
-        projection = {
-            "lastUpdatedDate": 1, "createdDate": 1, "sampleDelivered": 1, "sampleReceived": 1,
-            "sampleCollectionException": 1, "sampleDeliveryException": 1, "sampleCanceled": 1,
-            "kitCanceled": 1, "sampleProcessed": 1, "sampleResulted": 1, "sampleRejected": 1,
-            "collectionRecorded": 1, "sampleReceivedDiff": 1, "kitRegisteredDiff": 1,
-            "kitInTransit": 1, "kitInTransitDiff": 1, "kitDelivered": 1, "kitDeliveredDiff": 1,
-            "kitRegistered": 1, "sampleInTransit": 1, "sampleInTransitDiff": 1,
-            "sampleDeliveredDiff": 1, "sampleResultedDiff": 1, "sampleRejectedDiff": 1,
-            "orderPublished": 1, "orderPublishedDiff": 1, "sampleID": 1, "spotSku": 1,
-            "spotSkuType": 1, "orderID": 1, "businessKey": 1, "country": 1,
-            "registeredDate": 1, "targetDate": 1, "breaksGuarantee": 1, "droppedOffDate": 1,
-            "deliveredDate": 1, "receivedDate": 1, "resultedDate": 1, "rejectedDate": 1,
-            "publishedDate": 1, "shippingTime": 1, "labProcessingTime": 1, "reportPublishingTime": 1,
-            "totalProcessingTime": 1, "kitShippingTime": 1, "sampleCollectedDiff": 1
-        }
-        documents = collection.find({}, projection)
-        pd.set_option('display.max_columns', None)
-        documents_list = list(documents)
-        return documents_list
+        with stage("mongo.pull") as record:
+            documents = collection.find(query or {}, projection, batch_size=batch_size)
+            df = documents_to_frame(documents, fields, batch_size)
+            record["rows"] = len(df)
+        return df
     else:
         print("No MongoDB client available.")
-        return []
+        return documents_to_frame([], fields, batch_size)
@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+# headless: the reports run on servers and in worker processes without a display
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Where backfilled figures go, one per month (and segment)
+PLOT_DIR = os.getenv("PLOT_DIR", os.path.join("files", "plots"))
+# Worker processes rendering figures (1 renders them in this process)
+PLOT_WORKERS = int(os.getenv("PLOT_WORKERS", "1"))
+# Bumped whenever the figure layout changes so cached figures are redrawn
+PLOT_VERSION = 1
+# Figure path -> hash of the spec it was drawn from, kept in the directory of the figures
+MANIFEST_NAME = "plot_manifest.json"
+
+# (measure, panel title, x label) of the three processing-time panels
+PANELS = [
+    ("shippingTime", "USPS Shipping Times", "Shipping Time (days)"),
+    ("labProcessingTime", "USSL Lab Processing Times", "Lab Processing Time (days)"),
+    ("reportPublishingTime", "SiPhox Report Publishing Times", "Report Publishing Time (days)"),
+]
+_STAT_KEYS = ["med", "q1", "q3", "whislo", "whishi"]
+
+
+def figure_spec(path, title, stats):
+    """Everything needed to draw one processing-times figure: the output path, the title
+    and the box statistics of each panel (rows of box_stats_table for one month/segment,
+    indexed by measure; a missing measure draws an empty panel)."""
+    panels = []
+    for measure, panel_title, xlabel in PANELS:
+        box = {key: float(stats.loc[measure, key]) if measure in stats.index else float("nan") for key in _STAT_KEYS}
+        panels.append({"title": panel_title, "xlabel": xlabel, "box": box})
+    return {"path": path, "title": title, "panels": panels}
+
+def figure_specs(box_stats, directory=PLOT_DIR, by=None, prefix="processing_times"):
+    """One figure spec per month (and value of `by`) of a box_stats_table result, written
+    to `directory` as <prefix>_<YYYY-MM>[_<value>].png."""
+    groups = ["Year", "Month"] + ([by] if by else [])
+    specs = []
+    for key, stats in box_stats.groupby(groups, dropna=False, sort=True):
+        year, month = key[0], key[1]
+        name = f"{prefix}_{year}-{month:02d}"
+        title = f"Month {month} {year} Processing Times"
+        if by:
+            name += f"_{key[2]}"
+            title += f" ({key[2]})"
+        specs.append(figure_spec(os.path.join(directory, name + ".png"), title, stats.set_index("measure")))
+    return specs
+
+def spec_hash(spec):
+    """Content hash of a figure spec: the figure is only redrawn when this changes."""
+    payload = json.dumps([PLOT_VERSION, spec], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def render_figure(spec):
+    """Draw one 3-panel box plot figure on the Agg backend and save it to spec["path"]."""
+    fig, axes = plt.subplots(nrows=3, ncols=1, figsize=(15, 10))
+    fig.suptitle(spec["title"], fontsize=16)
+    for ax, panel in zip(axes, spec["panels"]):
+        box = dict(panel["box"], fliers=[])
+        ax.bxp([box], vert=False, patch_artist=True, showfliers=False)
+        ax.set_xlabel(panel["xlabel"])
+        ax.set_title(panel["title"])
+    fig.subplots_adjust(hspace=0.5)
+    directory = os.path.dirname(spec["path"])
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fig.savefig(spec["path"])
+    plt.close(fig)
+    return spec["path"]
+
+def _load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+def render_figures(specs, workers=PLOT_WORKERS):
+    """Render the figures whose spec changed since they were last drawn, in `workers`
+    processes if more than one. Returns (paths of all figures, paths actually drawn)."""
+    manifests = {}
+    stale = []
+    for spec in specs:
+        manifest_path = os.path.join(os.path.dirname(spec["path"]), MANIFEST_NAME)
+        manifest = manifests.setdefault(manifest_path, _load_manifest(manifest_path))
+        digest = spec_hash(spec)
+        if manifest.get(spec["path"]) != digest or not os.path.exists(spec["path"]):
+            stale.append((spec, manifest, digest))
+
+    if workers > 1 and len(stale) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            drawn = list(executor.map(render_figure, [spec for spec, _, _ in stale]))
+    else:
+        drawn = [render_figure(spec) for spec, _, _ in stale]
+
+    for spec, manifest, digest in stale:
+        manifest[spec["path"]] = digest
+    for manifest_path, manifest in manifests.items():
+        directory = os.path.dirname(manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(manifest_path, "w") as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+    return [spec["path"] for spec in specs], drawn
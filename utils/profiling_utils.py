@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import psutil
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Where stage records go: "stdout" (default), "off", or a file path to append JSON lines to
+STAGE_LOG = os.getenv("STAGE_LOG", "stdout")
+# Seconds between RSS samples while a stage runs
+RSS_SAMPLE_INTERVAL = 0.01
+
+_process = psutil.Process()
+
+def _mib(num_bytes):
+    return round(num_bytes / 1024 ** 2, 1)
+
+def log_stage(record):
+    """Emit one stage record as a JSON line (see STAGE_LOG)."""
+    if STAGE_LOG == "off":
+        return
+    line = json.dumps(record, default=str)
+    if STAGE_LOG == "stdout":
+        print(line)
+    else:
+        with open(STAGE_LOG, "a") as file:
+            file.write(line + "\n")
+
+@contextmanager
+def stage(name, rows=None, log=True, **fields):
+    """Measure a block of work: wall and CPU seconds, RSS and peak RSS growth.
+
+    Yields the record dict, so the block can fill in `rows` (or other fields) once it
+    knows them. The record is emitted with log_stage when the block exits, even if it
+    raised.
+
+        with stage("filter_vals") as record:
+            data = filter_vals(df)
+            record["rows"] = len(data)
+    """
+    record = {"stage": name, "rows": rows, **fields}
+    rss_before = _process.memory_info().rss
+    peak = [rss_before]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(RSS_SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], _process.memory_info().rss)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = datetime.now()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        done.set()
+        sampler.join()
+        rss_after = _process.memory_info().rss
+        peak[0] = max(peak[0], rss_after)
+        record.update({
+            "started": started.isoformat(timespec="milliseconds"),
+            "seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "rss_mib": _mib(rss_after),
+            "peak_rss_mib": _mib(peak[0]),
+            "peak_rss_delta_mib": _mib(peak[0] - rss_before),
+            "pid": os.getpid(),
+        })
+        if log:
+            log_stage(record)
+
+def run_profiled(fn, path, *args, **kwargs):
+    """Run fn under cProfile, write the stats to `path` and print the top functions.
+
+    The .prof file is the standard pstats format: open it with snakeviz, or turn it
+    into a flame graph with flameprof/gprof2dot.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        profiler.dump_stats(path)
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(25)
+        print(f"Profile written to {path}")
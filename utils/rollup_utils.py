@@ -0,0 +1,244 @@
+import numpy as np
+import pandas as pd
+
+# A row belongs to a month by its deliveredDate, receivedDate or rejectedDate (the monthly
+# report uses received/rejected, the dashboard delivered/received). Keying by all three
+# months, as year * 12 + month - 1 (-1 when the date is missing), puts every row in exactly
+# one key, so summing the keys that match a selection never counts a row twice.
+PERIOD_COLUMNS = {
+    "deliveredPeriod": "deliveredDate",
+    "receivedPeriod": "receivedDate",
+    "rejectedPeriod": "rejectedDate",
+}
+DIMENSION_COLUMNS = ["spotSku", "spotSkuType", "businessKey", "country"]
+KEY_COLUMNS = list(PERIOD_COLUMNS) + DIMENSION_COLUMNS
+
+# Durations whose mean the dashboard shows, summed over every row
+DASHBOARD_TIME_COLUMNS = ["totalProcessingTime", "kitShippingTime", "shippingTime", "labProcessingTime", "reportPublishingTime"]
+
+# Durations the monthly report buckets: (count column, sum column, band edges, whether
+# bands are closed on the right, band count columns), over the completed samples. The
+# breaks-guarantee bands of totalProcessingTime only count samples that break it.
+BANDED_TIMES = {
+    "shippingTime": ("kits_shipped_usps", "shipping_time_sum", [3, 5], True,
+                     ["shipped_under_3", "shipped_under_5", "shipped_over_5"]),
+    "labProcessingTime": ("samples_processed_ussl", "lab_processing_time_sum", [2, 4], True,
+                          ["processed_under_2", "processed_under_4", "processed_over_4"]),
+    "reportPublishingTime": ("reports_published_siphox", "report_publishing_time_sum", [2], True,
+                             ["published_under_2", "published_over_2"]),
+}
+BREAKS_GUARANTEE_BANDS = ("num_breaks_guarantee", None, [5, 7, 12], False,
+                          [None, "breaks_guarantee_under_7", "breaks_guarantee_under_12", "breaks_guarantee_max"])
+
+# Dashboard filters that the rollup keys cannot express, with the value meaning "no filter"
+_UNKEYED_FILTERS = {
+    "orderID": "", "sampleID": "",
+    "kitRegistered": None, "sampleDelivered": None, "sampleReceived": None, "sampleRejected": None,
+    "sampleResulted": None, "orderPublished": None, "breaksGuarantee": None, "sampleInTransit": None,
+    "sampleProcessed": None,
+    "kitShippingTime": (None, None), "shippingTime": (None, None), "labProcessingTime": (None, None),
+    "reportPublishingTime": (None, None), "totalProcessingTime": (None, None),
+}
+
+
+def _is_true(flags):
+    return flags.eq(True).fillna(False).to_numpy(bool)
+
+def _period(dates):
+    return (dates.dt.year * 12 + dates.dt.month - 1).fillna(-1).astype("int32")
+
+def period_of(year, month):
+    """Rollup period of a calendar month."""
+    return year * 12 + month - 1
+
+def key_values(df):
+    """Rollup key columns of each row of a prepared frame, as arrays."""
+    keys = {period: _period(df[column]).to_numpy() for period, column in PERIOD_COLUMNS.items()}
+    keys.update({column: df[column].astype(object).to_numpy() for column in DIMENSION_COLUMNS})
+    return keys
+
+def completed_mask(df):
+    """Resulted or rejected samples, the ones the monthly report measures."""
+    return _is_true(df["sampleResulted"]) | _is_true(df["sampleRejected"])
+
+def unsettled_mask(df):
+    """Rows whose contribution can still change with the clock alone.
+
+    breaksGuarantee of a dropped-off sample that is not resulted depends on the report
+    time, and only ever turns from False to True; every other column of a prepared row
+    is fixed until its document changes.
+    """
+    not_resulted = ~df["sampleResulted"].fillna(True).astype(bool).to_numpy()
+    return df["droppedOffDate"].notna().to_numpy() & not_resulted & ~_is_true(df["breaksGuarantee"])
+
+# Count (and sum) the durations of the `selected` rows, and count them per band of `edges`
+def _add_bands(out, durations, selected, count, total, edges, right, bands):
+    values = durations.to_numpy("float64", na_value=np.nan)
+    present = selected & ~np.isnan(values)
+    out[count] = present
+    if total:
+        out[total] = np.where(present, values, 0.0)
+    band = np.digitize(values, edges, right=right)
+    for index, name in enumerate(bands):
+        if name:
+            out[name] = present & (band == index)
+
+def contributions(df):
+    """Per-row measures of a prepared (as_of) frame, with its rollup key columns.
+
+    Summing these over the rows of a month gives the monthly report columns (which only
+    look at resulted/rejected samples) and the dashboard tiles (which look at every row).
+    """
+    completed = completed_mask(df)
+    out = key_values(df)
+
+    out["rows"] = np.ones(len(df), dtype="int64")
+    out["total_completed_samples"] = completed
+    out["total_kits_resulted"] = completed & _is_true(df["sampleResulted"])
+    out["total_kits_rejected"] = completed & _is_true(df["sampleRejected"])
+
+    # counts per duration band of the completed samples that have the duration
+    for column, measures in BANDED_TIMES.items():
+        _add_bands(out, df[column], completed, *measures)
+    _add_bands(out, df["totalProcessingTime"], completed & _is_true(df["breaksGuarantee"]), *BREAKS_GUARANTEE_BANDS)
+
+    total = df["totalProcessingTime"].to_numpy("float64", na_value=np.nan)
+    for column in DASHBOARD_TIME_COLUMNS:
+        values = df[column].to_numpy("float64", na_value=np.nan)
+        out[f"{column}_count"] = ~np.isnan(values)
+        out[f"{column}_sum"] = np.nan_to_num(values)
+    out["samples_processed"] = _is_true(df["sampleProcessed"])
+    out["samples_overdue"] = _is_true(df["breaksGuarantee"])
+    out["samples_on_time"] = total <= 5
+
+    out = pd.DataFrame(out, index=df.index)
+    measures = [column for column in out.columns if column not in KEY_COLUMNS]
+    out[measures] = out[measures].astype({column: "int64" for column in measures if not column.endswith("_sum")})
+    return out
+
+def _aggregate(parts):
+    rollup = pd.concat(parts, ignore_index=True).groupby(KEY_COLUMNS, dropna=False, sort=True).sum().reset_index()
+    # keys whose rows all moved elsewhere are left with zero counts (and float dust in the sums)
+    return rollup[rollup["rows"] != 0].reset_index(drop=True)
+
+def build_rollup(df):
+    """Rollup of a prepared frame: one row per key with the summed contributions."""
+    return _aggregate([contributions(df)])
+
+def update_rollup(rollup, removed=None, added=None):
+    """Apply a change to a rollup: subtract the contributions of the `removed` rows (as
+    they were added before) and add those of the `added` rows."""
+    parts = [rollup]
+    if removed is not None and len(removed):
+        removed = contributions(removed)
+        measures = [column for column in removed.columns if column not in KEY_COLUMNS]
+        removed[measures] = -removed[measures]
+        parts.append(removed)
+    if added is not None and len(added):
+        parts.append(contributions(added))
+    return _aggregate(parts)
+
+# Columns of the monthly summary: (column, count column, sum column) for the averages,
+# plain count columns otherwise
+SUMMARY_COLUMNS = [
+    "total_completed_samples", "total_kits_resulted", "total_kits_rejected",
+    "kits_shipped_usps", ("avg_shipping_time", "kits_shipped_usps", "shipping_time_sum"),
+    "shipped_under_3", "shipped_under_5", "shipped_over_5",
+    "samples_processed_ussl", ("avg_lab_processing_time", "samples_processed_ussl", "lab_processing_time_sum"),
+    "processed_under_2", "processed_under_4", "processed_over_4",
+    "reports_published_siphox", ("avg_report_publishing_time", "reports_published_siphox", "report_publishing_time_sum"),
+    "published_under_2", "published_over_2",
+    ("avg_total_processing_time", "totalProcessingTime_count", "totalProcessingTime_sum"),
+    "num_breaks_guarantee", "breaks_guarantee_under_7", "breaks_guarantee_under_12", "breaks_guarantee_max",
+]
+
+def _warning(uncounted_kits):
+    if uncounted_kits > 0:
+        return f"WARNING: there are {uncounted_kits} samples in this data that are not resulted or rejected"
+    if uncounted_kits < 0:
+        return f"WARNING: there are {uncounted_kits * -1} samples in this data that are both resulted and rejected"
+    return ""
+
+def monthly_summary(rows, periods):
+    """The monthly report table for `periods`, a list of (year, month).
+
+    `rows` is a rollup or the contributions of a prepared frame. A row counts in the month
+    of its receivedDate and in that of its rejectedDate, so the table is the sum of two
+    groupbys: by received month, and by rejected month over the rows where that month
+    differs. A Year column is added when the periods span more than one year.
+    """
+    keys = [period_of(year, month) for year, month in periods]
+    measures = [column for column in rows.columns if column not in KEY_COLUMNS]
+    received, rejected = rows["receivedPeriod"], rows["rejectedPeriod"]
+    totals = rows.groupby(received)[measures].sum().add(
+        rows[rejected != received].groupby(rejected)[measures].sum(), fill_value=0
+    ).reindex(keys, fill_value=0)
+    totals = totals.astype({column: "int64" for column in measures if not column.endswith("_sum")})
+
+    summary = {}
+    if len({year for year, _ in periods}) > 1:
+        summary["Year"] = [year for year, _ in periods]
+    summary["Month"] = [month for _, month in periods]
+    for column in SUMMARY_COLUMNS:
+        if isinstance(column, tuple):
+            column, count, total = column
+            counts = totals[count].to_numpy()
+            # the mean of a float32 duration column is a float32, rounded as such
+            means = (totals[total] / np.maximum(counts, 1)).to_numpy("float32")
+            summary[column] = np.where(counts > 0, means.round(2), np.float32("nan"))
+        else:
+            summary[column] = totals[column].to_numpy()
+    uncounted_kits = totals["total_completed_samples"] - (totals["total_kits_resulted"] + totals["total_kits_rejected"])
+    summary["warning"] = [_warning(uncounted) for uncounted in uncounted_kits]
+    return pd.DataFrame(summary)
+
+def frame_metrics(df):
+    """The dashboard tiles computed from (filtered) rows."""
+    metrics = {column: df[column].mean() for column in DASHBOARD_TIME_COLUMNS}
+    metrics["samples_processed"] = int(df["sampleProcessed"].sum())
+    metrics["samples_overdue"] = int(df["breaksGuarantee"].sum())
+    metrics["samples_on_time"] = int((df["totalProcessingTime"] <= 5).sum())
+    return metrics
+
+def _matches(periods, years, months):
+    year, month = periods // 12, periods % 12 + 1
+    match = periods >= 0
+    if years:
+        match &= year.isin(years)
+    if months:
+        match &= month.isin(months)
+    return match
+
+# Column sums of the selected rollup rows, keeping counts as integers
+def _totals(rollup):
+    return {column: rollup[column].sum() for column in rollup.columns if column not in KEY_COLUMNS}
+
+def rollup_metrics(rollup, filters):
+    """The dashboard tiles read from a rollup, or None when `filters` use a column the
+    rollup is not keyed by (IDs, event flags, time ranges)."""
+    for column, unfiltered in _UNKEYED_FILTERS.items():
+        value = filters.get(column, unfiltered)
+        if value != unfiltered and value != "ALL":
+            return None
+
+    mask = pd.Series(True, index=rollup.index)
+    for column in DIMENSION_COLUMNS:
+        if filters.get(column):
+            # missing values are None once the rollup went through Parquet
+            selected = rollup[column].isin(filters[column])
+            if pd.isna(filters[column]).any():
+                selected |= rollup[column].isna()
+            mask &= selected
+    years, months = filters.get("selectedYears"), filters.get("selectedMonths")
+    if years or months:
+        mask &= _matches(rollup["deliveredPeriod"], years, months) | _matches(rollup["receivedPeriod"], years, months)
+
+    totals = _totals(rollup[mask])
+    metrics = {
+        column: totals[f"{column}_sum"] / totals[f"{column}_count"] if totals[f"{column}_count"] else np.nan
+        for column in DASHBOARD_TIME_COLUMNS
+    }
+    metrics["samples_processed"] = int(totals["samples_processed"])
+    metrics["samples_overdue"] = int(totals["samples_overdue"])
+    metrics["samples_on_time"] = int(totals["samples_on_time"])
+    return metrics
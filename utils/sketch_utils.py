@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+from utils.rollup_utils import KEY_COLUMNS, period_of, key_values, completed_mask
+from utils.snapshot_utils import load_snapshot, save_snapshot
+
+# Processing stages sketched, over the resulted/rejected samples like the monthly report
+SKETCH_COLUMNS = ["shippingTime", "labProcessingTime", "reportPublishingTime"]
+# Every quantile is within this relative error of a true value of the data
+RELATIVE_ACCURACY = 0.01
+# Durations are rounded to 1e-3 days; anything smaller in magnitude counts as zero
+MIN_VALUE = 1e-3
+DEFAULT_QUANTILES = [0.5, 0.9, 0.99]
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = np.log(_GAMMA)
+
+
+def bucket_of(values):
+    """Sketch bucket of each value (DDSketch-style logarithmic buckets).
+
+    Bucket k + 1 holds the values in (MIN_VALUE * gamma^(k-1), MIN_VALUE * gamma^k], so
+    any value is within RELATIVE_ACCURACY of its bucket's representative; bucket 0 holds
+    zeros and negative values use the negated bucket of their magnitude. Buckets sort in
+    the order of their values.
+    """
+    values = np.asarray(values, dtype="float64")
+    magnitude = np.abs(values)
+    large = magnitude >= MIN_VALUE
+    k = np.ceil(np.log(np.where(large, magnitude, MIN_VALUE) / MIN_VALUE) / _LOG_GAMMA)
+    return np.where(large, np.sign(values) * (k + 1), 0).astype("int64")
+
+def bucket_value(buckets):
+    """Representative value of each bucket."""
+    buckets = np.asarray(buckets, dtype="int64")
+    magnitude = MIN_VALUE * 2 * _GAMMA ** (np.abs(buckets) - 1.0) / (_GAMMA + 1)
+    return np.where(buckets == 0, 0.0, np.sign(buckets) * magnitude)
+
+def build_sketches(df):
+    """Sketches of SKETCH_COLUMNS in one pass over a prepared (as_of) frame.
+
+    The result is a long table of bucket counts (rollup key columns, measure, bucket,
+    count), so sketches of any months or segments merge by summing counts.
+    """
+    completed = completed_mask(df)
+    keys = key_values(df)
+    parts = []
+    for column in SKETCH_COLUMNS:
+        values = df[column].to_numpy("float64", na_value=np.nan)
+        present = completed & ~np.isnan(values)
+        part = pd.DataFrame({key: key_column[present] for key, key_column in keys.items()})
+        part["measure"] = column
+        part["bucket"] = bucket_of(values[present])
+        parts.append(part)
+    rows = pd.concat(parts, ignore_index=True)
+    return rows.groupby(KEY_COLUMNS + ["measure", "bucket"], dropna=False, sort=True).size().rename("count").reset_index()
+
+def merge_sketches(*sketches):
+    """Merge sketch tables (e.g. of separate months or backfill chunks)."""
+    merged = pd.concat(sketches, ignore_index=True)
+    merged = merged.groupby(KEY_COLUMNS + ["measure", "bucket"], dropna=False, sort=True)["count"].sum().reset_index()
+    return merged[merged["count"] != 0].reset_index(drop=True)
+
+def select_sketches(sketches, periods=None, **dimensions):
+    """The sketch rows of samples received or rejected in one of `periods` ((year, month)
+    pairs, default all) and, for each dimension given, with one of its values."""
+    mask = pd.Series(True, index=sketches.index)
+    if periods is not None:
+        keys = [period_of(year, month) for year, month in periods]
+        mask &= sketches["receivedPeriod"].isin(keys) | sketches["rejectedPeriod"].isin(keys)
+    for column, values in dimensions.items():
+        selected = sketches[column].isin(values)
+        if pd.isna(values).any():
+            selected |= sketches[column].isna()
+        mask &= selected
+    return sketches[mask]
+
+# Bucket counts of one measure merged over the given sketch rows, in value order
+def _histogram(sketches, measure):
+    rows = sketches[sketches["measure"] == measure]
+    histogram = rows.groupby("bucket")["count"].sum()
+    return histogram[histogram > 0]
+
+# Value at each quantile of a merged histogram (rank q * (n - 1), like the lower quantile)
+def _quantile_values(histogram, qs):
+    if histogram.empty:
+        return np.full(len(qs), np.nan)
+    cumulative = histogram.to_numpy().cumsum()
+    ranks = np.asarray(qs) * (cumulative[-1] - 1)
+    positions = np.searchsorted(cumulative, ranks, side="right")
+    return bucket_value(histogram.index.to_numpy()[positions])
+
+def quantiles(sketches, qs=DEFAULT_QUANTILES):
+    """Sample count and quantiles (p50, p90, ...) of each measure over the given sketch rows."""
+    table = {}
+    for measure in SKETCH_COLUMNS:
+        histogram = _histogram(sketches, measure)
+        row = {"count": int(histogram.sum())}
+        row.update({f"p{q * 100:g}": value for q, value in zip(qs, _quantile_values(histogram, qs))})
+        table[measure] = row
+    return pd.DataFrame.from_dict(table, orient="index")
+
+def period_quantiles(sketches, periods, qs=DEFAULT_QUANTILES):
+    """One row per (year, month) and measure with the count and quantiles of that month,
+    rounded to the 1e-3 days durations are kept at."""
+    tables = []
+    for year, month in periods:
+        table = quantiles(select_sketches(sketches, [(year, month)]), qs)
+        tables.append(table.rename_axis("measure").reset_index().assign(Year=year, Month=month))
+    table = pd.concat(tables, ignore_index=True).round(3)
+    return table[["Year", "Month"] + [column for column in table.columns if column not in ("Year", "Month")]]
+
+def box_stats_table(sketches, periods, by=None, whis=1.5):
+    """Box plot statistics of every measure for each of `periods` ((year, month) pairs),
+    split by the dimension column `by` if given, in one grouped pass over the sketches.
+
+    One row per (Year, Month, [by,] measure) that has data, with count, q1, med, q3 and
+    whiskers as boxplot(whis=1.5) draws them. Like the monthly report, a sample counts in
+    the month it was received and in the month it was rejected.
+    """
+    keys = {period_of(year, month): (year, month) for year, month in periods}
+    received, rejected = sketches["receivedPeriod"], sketches["rejectedPeriod"]
+    rows = pd.concat([
+        sketches.assign(period=received),
+        sketches[rejected != received].assign(period=rejected[rejected != received]),
+    ], ignore_index=True)
+    rows = rows[rows["period"].isin(list(keys))]
+    groups = ["period"] + ([by] if by else []) + ["measure"]
+
+    histogram = rows.groupby(groups + ["bucket"], dropna=False, sort=True)["count"].sum().reset_index()
+    histogram = histogram[histogram["count"] > 0].reset_index(drop=True)
+    value = pd.Series(bucket_value(histogram["bucket"]), index=histogram.index)
+    by_group = [histogram[column] for column in groups]
+    cumulative = histogram.groupby(groups, dropna=False, sort=False)["count"].cumsum()
+    total = histogram.groupby(groups, dropna=False, sort=False)["count"].transform("sum")
+
+    # first bucket whose cumulative count passes the rank, per group (buckets are sorted)
+    def quantile(q):
+        return value.where(cumulative > q * (total - 1)).groupby(by_group, dropna=False).transform("min")
+
+    q1, med, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    iqr = q3 - q1
+    stats = pd.DataFrame({
+        "count": total, "q1": q1, "med": med, "q3": q3,
+        "whislo": np.minimum(value.where(value >= q1 - whis * iqr).groupby(by_group, dropna=False).transform("min"), q1),
+        "whishi": np.maximum(value.where(value <= q3 + whis * iqr).groupby(by_group, dropna=False).transform("max"), q3),
+    })
+    stats = pd.concat([histogram[groups], stats], axis=1).drop_duplicates(groups).reset_index(drop=True)
+    year_month = stats.pop("period").map(keys)
+    stats.insert(0, "Year", year_month.str[0])
+    stats.insert(1, "Month", year_month.str[1])
+    return stats
+
+def save_sketches(sketches, path):
+    """Write a sketch table to `path` as Parquet."""
+    save_snapshot(sketches, path, None, extra={"relative_accuracy": RELATIVE_ACCURACY, "min_value": MIN_VALUE})
+
+def load_sketches(path):
+    """Load a sketch table written by save_sketches, or None if there is none."""
+    sketches, _ = load_snapshot(path)
+    return sketches
@@ -3,6 +3,7 @@ import datetime
 import os
 import requests
 from dotenv import load_dotenv
+from utils.profiling_utils import stage
 
 load_dotenv()
 USSL_CHANNEL_ID = os.getenv("USSL_CHANNEL_ID")
@@ -16,6 +17,11 @@ def check_slack_connection(slack_client):
 
 # sends slack message
 def send_slack_message(token, message, input_files, slack_channel_id=USSL_CHANNEL_ID):
+    with stage("slack.upload", files=len(input_files)):
+        _send_slack_message(token, message, input_files, slack_channel_id)
+
+# uploads the files and posts them with the message
+def _send_slack_message(token, message, input_files, slack_channel_id):
     slack_client = WebClient(token)
     check_slack_connection(slack_client)
 
@@ -0,0 +1,68 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Key of the snapshot metadata in the Parquet schema metadata
+METADATA_KEY = b"siphox_snapshot"
+
+
+def query_hash(query, projection=None, version=None):
+    """Stable hash of the Mongo query, projection and pipeline version of a snapshot."""
+    payload = json.dumps([query, projection, version], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def read_snapshot_metadata(path):
+    """Return the metadata dict of a snapshot (without reading its rows), or None."""
+    if not os.path.exists(path):
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    if METADATA_KEY not in metadata:
+        return None
+    metadata = json.loads(metadata[METADATA_KEY])
+    metadata["watermark"] = datetime.fromisoformat(metadata["watermark"]) if metadata["watermark"] else None
+    metadata["created"] = datetime.fromisoformat(metadata["created"])
+    return metadata
+
+def load_snapshot(path, expected_hash=None):
+    """Load a prepared-data snapshot and its metadata (query_hash, watermark, created).
+
+    Returns (None, None) when no snapshot has been written yet or it was built
+    from a different query.
+    """
+    metadata = read_snapshot_metadata(path)
+    if metadata is None or metadata["query_hash"] != expected_hash:
+        return None, None
+    return pq.read_table(path).to_pandas(), metadata
+
+def save_snapshot(df, path, watermark, expected_hash=None, extra=None):
+    """Atomically write the prepared rows to `path` as Parquet with their metadata.
+
+    `extra` adds JSON-serialisable fields to the metadata. Returns the metadata as
+    read_snapshot_metadata would.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    metadata = {
+        "query_hash": expected_hash,
+        "watermark": watermark.isoformat() if watermark is not None else None,
+        "created": datetime.now().isoformat(),
+        **(extra or {}),
+    }
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        METADATA_KEY: json.dumps(metadata).encode("utf-8"),
+    })
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return {**metadata, "watermark": watermark, "created": datetime.fromisoformat(metadata["created"])}
+
+def invalidate_snapshot(path):
+    """Delete a snapshot so the next run rebuilds it from Mongo."""
+    if os.path.exists(path):
+        os.remove(path)
@@ -1,10 +1,26 @@
 import streamlit as st
-import pandas as pd
+import numpy as np
 from datetime import datetime
 
-def generate_dictionary(df, preset_values=None):
+# Columns of the multiselect filters and of the time range filters
+OPTION_COLUMNS = ["businessKey", "spotSku", "spotSkuType", "country"]
+RANGE_COLUMNS = ["kitShippingTime", "shippingTime", "labProcessingTime", "reportPublishingTime", "totalProcessingTime"]
+
+def widget_metadata(df):
+    """Options of the multiselect filters and (min, max) of the time range filters, computed
+    once per data refresh and shared by every session instead of scanning the columns on
+    each rerun."""
+    return {
+        "options": {column: df[column].unique().tolist() for column in OPTION_COLUMNS},
+        "ranges": {column: (df[column].min(), df[column].max()) for column in RANGE_COLUMNS},
+    }
+
+def generate_dictionary(df, preset_values=None, metadata=None):
     if preset_values is None:
         preset_values = {}
+    if metadata is None:
+        metadata = widget_metadata(df)
+    options, ranges = metadata["options"], metadata["ranges"]
 
     # Sidebar widgets
     st.sidebar.header("General Filters")
@@ -14,25 +30,25 @@ def generate_dictionary(df, preset_values=None):
     
     business_key = st.sidebar.multiselect(
         'Business Key',
-        options=df['businessKey'].unique().tolist(),
+        options=options['businessKey'],
         default=preset_values.get("business_key", [])
     )
     
     spot_sku = st.sidebar.multiselect(
         'Spot SKU',
-        options=df['spotSku'].unique().tolist(),
+        options=options['spotSku'],
         default=preset_values.get("spot_sku", [])
     )
 
     spot_sku_type = st.sidebar.multiselect(
         'Spot SKU Type',
-        options=df['spotSkuType'].unique().tolist(),
+        options=options['spotSkuType'],
         default=preset_values.get("spot_sku_type", [])
     )
 
     country = st.sidebar.multiselect(
         'Country',
-        options=df['country'].unique().tolist(),
+        options=options['country'],
         default=preset_values.get("country", [])
     )
     
@@ -60,11 +76,11 @@ def generate_dictionary(df, preset_values=None):
     total_processing_time = st.sidebar.checkbox('Total Processing Time', value=preset_values.get("total_processing_time", False))
 
     range_columns = {
-        "kitShippingTime": range_input('KIT Shipping Time', df['shippingTime'].min(), df['shippingTime'].max(), *preset_values.get("range_columns", {}).get("kitShippingTime", (None, None))) if kit_shipping_time else (None, None),
-        "shippingTime": range_input('Shipping Time', df['shippingTime'].min(), df['shippingTime'].max(), *preset_values.get("range_columns", {}).get("shippingTime", (None, None))) if shipping_time else (None, None),
-        "labProcessingTime": range_input('Lab Processing Time', df['labProcessingTime'].min(), df['labProcessingTime'].max(), *preset_values.get("range_columns", {}).get("labProcessingTime", (None, None))) if lab_processing_time else (None, None),
-        "reportPublishingTime": range_input('Report Publishing Time', df['reportPublishingTime'].min(), df['reportPublishingTime'].max(), *preset_values.get("range_columns", {}).get("reportPublishingTime", (None, None))) if report_publishing_time else (None, None),
-        "totalProcessingTime": range_input('Total Processing Time', df['totalProcessingTime'].min(), df['totalProcessingTime'].max(), *preset_values.get("range_columns", {}).get("totalProcessingTime", (None, None))) if total_processing_time else (None, None)
+        "kitShippingTime": range_input('KIT Shipping Time', *ranges['kitShippingTime'], *preset_values.get("range_columns", {}).get("kitShippingTime", (None, None))) if kit_shipping_time else (None, None),
+        "shippingTime": range_input('Shipping Time', *ranges['shippingTime'], *preset_values.get("range_columns", {}).get("shippingTime", (None, None))) if shipping_time else (None, None),
+        "labProcessingTime": range_input('Lab Processing Time', *ranges['labProcessingTime'], *preset_values.get("range_columns", {}).get("labProcessingTime", (None, None))) if lab_processing_time else (None, None),
+        "reportPublishingTime": range_input('Report Publishing Time', *ranges['reportPublishingTime'], *preset_values.get("range_columns", {}).get("reportPublishingTime", (None, None))) if report_publishing_time else (None, None),
+        "totalProcessingTime": range_input('Total Processing Time', *ranges['totalProcessingTime'], *preset_values.get("range_columns", {}).get("totalProcessingTime", (None, None))) if total_processing_time else (None, None)
     }
 
     st.sidebar.header("Other")
@@ -129,65 +145,74 @@ def generate_dictionary(df, preset_values=None):
 
     return data_dict
 
-def filter_dataframe(df, filters):
-    # Ensure date columns are in datetime format
-    if "sampleDelivered" in df.columns:
-        df['sampleDelivered'] = pd.to_datetime(df['sampleDelivered'], errors='coerce')
-    if "sampleReceived" in df.columns:
-        df['sampleReceived'] = pd.to_datetime(df['sampleReceived'], errors='coerce')
-
-    if filters["orderID"]:
-        df = df[df["orderID"].str.contains(filters["orderID"], na=False)]
-    if filters["sampleID"]:
-        df = df[df["sampleID"].str.contains(filters["sampleID"], na=False)]
-    if filters["businessKey"]:
-        df = df[df["businessKey"].isin(filters["businessKey"])]
-    if filters["country"]:
-        df = df[df["country"].isin(filters["country"])]
-    if filters["spotSku"]:
-        df = df[df["spotSku"].isin(filters["spotSku"])]
-    if filters["spotSkuType"]:
-        df = df[df["spotSkuType"].isin(filters["spotSkuType"])]
-
-    bool_columns = ["kitRegistered", "sampleDelivered", "sampleReceived", 
-                    "sampleRejected", "sampleResulted", "orderPublished", 
-                    "breaksGuarantee", "sampleInTransit", "sampleProcessed"]
-
-    for col in bool_columns:
-        if filters[col] != 'ALL':
-            if filters[col] == 'True':
-                df = df[df[col] == True]
-            elif filters[col] == 'False':
-                df = df[df[col] == False]
-
-    range_columns = ["kitShippingTime", "shippingTime", "labProcessingTime", "reportPublishingTime", "totalProcessingTime"]
-    for col in range_columns:
-        min_val, max_val = filters[col]
+# Year/month keys of the dates the year and month filters look at (0 when the date is missing)
+FILTER_KEY_COLUMNS = ["deliveredYear", "deliveredMonth", "receivedYear", "receivedMonth"]
+BOOL_FILTER_COLUMNS = ["kitRegistered", "sampleDelivered", "sampleReceived",
+                       "sampleRejected", "sampleResulted", "orderPublished",
+                       "breaksGuarantee", "sampleInTransit", "sampleProcessed"]
+
+def add_filter_keys(df):
+    """Add the FILTER_KEY_COLUMNS to a frame, once per data load (as_of carries them along),
+    so filtering never has to take dates apart."""
+    keys = {}
+    for prefix, column in (("delivered", "deliveredDate"), ("received", "receivedDate")):
+        dates = df[column]
+        keys[f"{prefix}Year"] = dates.dt.year.fillna(0).astype("int16")
+        keys[f"{prefix}Month"] = dates.dt.month.fillna(0).astype("int8")
+    return df.assign(**keys)
+
+def _filter_keys(df):
+    if all(column in df.columns for column in FILTER_KEY_COLUMNS):
+        return {column: df[column].to_numpy() for column in FILTER_KEY_COLUMNS}
+    keys = add_filter_keys(df[["deliveredDate", "receivedDate"]])
+    return {column: keys[column].to_numpy() for column in FILTER_KEY_COLUMNS}
+
+def _is_true(values):
+    return values.eq(True).fillna(False).to_numpy(bool)
+
+def filter_mask(df, filters):
+    """Boolean array of the rows of `df` matching the sidebar filters, combined in one mask.
+    The substring filters only look at the rows the others kept."""
+    mask = np.ones(len(df), dtype=bool)
+    for column in ["businessKey", "country", "spotSku", "spotSkuType"]:
+        if filters[column]:
+            mask &= df[column].isin(filters[column]).to_numpy(bool)
+
+    for column in BOOL_FILTER_COLUMNS:
+        if filters[column] == 'True':
+            mask &= _is_true(df[column])
+        elif filters[column] == 'False':
+            mask &= _is_true(df[column].eq(False))
+
+    for column in RANGE_COLUMNS:
+        min_val, max_val = filters[column]
         if min_val is not None and max_val is not None:
-            df = df[df[col].notnull() & (df[col] >= min_val) & (df[col] <= max_val)]
-
-    # Filter by selected years and months for sampleDelivered/sampleReceived
-    if filters["selectedYears"]:
-        # Filter by years only
-        if not filters["selectedMonths"]:
-            df = df[
-                (df["deliveredDate"].dt.year.isin(filters["selectedYears"])) |
-                (df["receivedDate"].dt.year.isin(filters["selectedYears"]))
-            ]
-        # Filter by both years and months
-        else:
-            df = df[
-                ((df["deliveredDate"].dt.year.isin(filters["selectedYears"])) & 
-                (df["deliveredDate"].dt.month.isin(filters["selectedMonths"]))) |
-                ((df["receivedDate"].dt.year.isin(filters["selectedYears"])) & 
-                (df["receivedDate"].dt.month.isin(filters["selectedMonths"])))
-            ]
-
-    # Handle case when only months are selected (if needed)
-    if filters["selectedMonths"] and not filters["selectedYears"]:
-        df = df[
-            (df["deliveredDate"].dt.month.isin(filters["selectedMonths"])) |
-            (df["receivedDate"].dt.month.isin(filters["selectedMonths"]))
-        ]
-
-    return df.reset_index(drop=True)  # Reset index after filtering
+            values = df[column].to_numpy("float64", na_value=np.nan)
+            mask &= (values >= min_val) & (values <= max_val)
+
+    # Filter by selected years and/or months for sampleDelivered/sampleReceived
+    years, months = filters["selectedYears"], filters["selectedMonths"]
+    if years or months:
+        keys = _filter_keys(df)
+        delivered = np.ones(len(df), dtype=bool)
+        received = np.ones(len(df), dtype=bool)
+        if years:
+            delivered &= np.isin(keys["deliveredYear"], years)
+            received &= np.isin(keys["receivedYear"], years)
+        if months:
+            delivered &= np.isin(keys["deliveredMonth"], months)
+            received &= np.isin(keys["receivedMonth"], months)
+        mask &= delivered | received
+
+    for column in ["orderID", "sampleID"]:
+        if filters[column]:
+            kept = np.flatnonzero(mask)
+            matches = df[column].iloc[kept].str.contains(filters[column], na=False).to_numpy(bool)
+            mask[kept[~matches]] = False
+    return mask
+
+def filter_dataframe(df, filters):
+    """The rows of `df` matching the sidebar filters (see filter_mask), copied once, without
+    the filter key columns."""
+    columns = [column for column in df.columns if column not in FILTER_KEY_COLUMNS]
+    return df.loc[filter_mask(df, filters), columns].reset_index(drop=True)